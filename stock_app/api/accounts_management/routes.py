@@ -6,7 +6,11 @@ import sqlite3
 
 from flask import Response, jsonify, request
 
-from stock_app.api.data_utils.loading_utils import execute_stock_q
+from stock_app.api.data_utils.loading_utils import (
+    day_number_sql,
+    execute_stock_q,
+)
+from stock_app.api.data_utils.trading_calendar import get_trading_calendar
 from stock_app.api.route_utils.decorators import (
     authenticate_request,
     log_route,
@@ -57,10 +61,7 @@ def add_account():
             return jsonify({"error": "Account already exists"}), 409
 
         query_insert = "INSERT INTO accounts (name) VALUES (?)"
-        execute_stock_q(query_insert, (name,), fetch_all=False)
-
-        id_check = "SELECT id FROM accounts WHERE name = ?"
-        account_id = execute_stock_q(id_check, (name,), fetch_all=False)[0]
+        account_id = execute_stock_q(query_insert, (name,)).lastrowid
 
         return jsonify({"account_id": int(account_id)}), 201
 
@@ -213,23 +214,9 @@ def add_stock_data():
         number_of_shares_v = data.get("number_of_shares")
 
         # Validate purchase and sale dates
-        purchase_date_query = """
-        SELECT Distinct Date
-        FROM stocks
-        WHERE Date = ?
-        """
-        sale_date_query = """
-        SELECT Distinct Date
-        FROM stocks
-        WHERE Date = ?
-        """
-
-        purchase_date_in_stock = execute_stock_q(
-            purchase_date_query, (purchase_date_v,), fetch_all=False
-        )
-        sale_date_in_stock = execute_stock_q(
-            sale_date_query, (sale_date_v,), fetch_all=False
-        )
+        calendar = get_trading_calendar()
+        purchase_date_in_stock = calendar.is_trading_day(purchase_date_v)
+        sale_date_in_stock = calendar.is_trading_day(sale_date_v)
 
         if not purchase_date_in_stock or not sale_date_in_stock:
             return jsonify({"error": "Invalid date"}), 400
@@ -291,10 +278,10 @@ def delete_stock_data():
         """
 
         # Execute the query using the helper function
-        cursor = execute_stock_q(query, parameters, fetch_all=False)
+        result = execute_stock_q(query, parameters, fetch_all=False)
 
         # Check if a row was deleted
-        if cursor.rowcount == 0:
+        if result.rowcount == 0:
             return jsonify({"error": "Stock data not found for deletion"}), 404
 
         return "", 204
@@ -332,7 +319,9 @@ def calculate_account_returns(account_id):
             return jsonify({"error": "Account not found"}), 404
 
         # Calculate the nominal return
-        query_return = """
+        purchase_day = day_number_sql("stocks_owned.purchase_date")
+        sale_day = day_number_sql("stocks_owned.sale_date")
+        query_return = f"""
         SELECT
             SUM(
                 stocks_owned.number_of_shares *
@@ -341,13 +330,16 @@ def calculate_account_returns(account_id):
         FROM
             stocks_owned
         INNER JOIN
-            stocks AS open_prices
-            ON stocks_owned.symbol = open_prices.Symbol
-            AND stocks_owned.purchase_date = open_prices.Date
+            symbols
+            ON stocks_owned.symbol = symbols.Symbol
+        INNER JOIN
+            prices AS open_prices
+            ON symbols.id = open_prices.symbol_id
+            AND open_prices.day = {purchase_day}
         INNER JOIN
-            stocks AS close_prices
-            ON stocks_owned.symbol = close_prices.Symbol
-            AND stocks_owned.sale_date = close_prices.Date
+            prices AS close_prices
+            ON symbols.id = close_prices.symbol_id
+            AND close_prices.day = {sale_day}
         WHERE
             stocks_owned.account_id = ?
         """
@@ -0,0 +1,83 @@
+"""Break a backtest's P&L down by symbol and by trading day.
+
+The breakdown is accumulated from the same daily P&L arrays the engines
+total, so a detailed backtest costs one pass over the prices. Each
+symbol's days are added in date order, so its total equals a backtest
+restricted to that symbol.
+"""
+
+import numpy as np
+
+from stock_app.api.data_utils.trading_calendar import format_day
+
+
+class BacktestBreakdown:
+    """Per-symbol totals and a daily equity curve of one backtest."""
+
+    def __init__(self, days):
+        """Start an empty breakdown.
+
+        Args:
+            days (numpy.ndarray): Ascending day numbers of the equity curve,
+                the trading days of the backtest window.
+        """
+        self.days = np.asarray(days, dtype=np.int64)
+        self.daily = np.zeros(len(self.days))
+        self.symbol_totals = {}
+
+    def add(self, day_totals, symbols, days):
+        """Add daily P&L entries.
+
+        Entries of one symbol must be contiguous and in date order, and
+        must follow any entries of that symbol added earlier.
+
+        Args:
+            day_totals (numpy.ndarray): P&L of each entry.
+            symbols (numpy.ndarray): Symbol of each entry.
+            days (numpy.ndarray): Day number of each entry.
+        """
+        if not len(day_totals):
+            return
+        self.daily += np.bincount(
+            np.searchsorted(self.days, days),
+            weights=day_totals,
+            minlength=len(self.days),
+        )
+        starts = np.flatnonzero(symbols[1:] != symbols[:-1]) + 1
+        for segment, start in zip(
+            np.split(day_totals, starts),
+            [0, *starts],
+            strict=True,
+        ):
+            symbol = str(symbols[start])
+            total, count = self.symbol_totals.get(symbol, (0, 0))
+            # Running sum in date order, as in `engine.sum_day_totals`
+            total = float(np.cumsum(np.concatenate([[total], segment]))[-1])
+            self.symbol_totals[symbol] = (total, count + len(segment))
+
+    def as_dict(self):
+        """Describe the breakdown with returns rounded like the total.
+
+        Returns:
+            dict: `symbols`, the return and observations of each symbol
+                with at least one observation, sorted by symbol, and
+                `equity_curve`, the cumulative return after each trading
+                day.
+        """
+        equity = np.cumsum(self.daily)
+        return {
+            "symbols": [
+                {
+                    "symbol": symbol,
+                    "return": round(total, 2),
+                    "num_observations": count,
+                }
+                for symbol, (total, count) in sorted(
+                    self.symbol_totals.items()
+                )
+            ],
+            "equity_curve": [
+                {"date": format_day(int(day)), "equity": round(value, 2)}
+                for day, value in zip(self.days, equity.tolist(), strict=True)
+            ],
+        }
@@ -0,0 +1,628 @@
+"""Evaluate backtests over the in-memory price cube or streamed prices.
+
+With the default `cube` engine, backtests run on the in-memory price cube
+in the calling thread, or, for large windows when `BACKTEST_WORKERS` is
+above 1, split by symbol across a process pool whose workers read the
+prices from shared memory.
+
+With `BACKTEST_ENGINE=stream` the cube is never loaded: prices are read
+from the database one window of trading days at a time, keeping only the
+rows later windows need for their lags, so memory is bounded by the
+window size.
+"""
+
+import atexit
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from itertools import pairwise
+from multiprocessing import get_context
+
+import numpy as np
+
+from stock_app.api.backtesting.breakdown import BacktestBreakdown
+from stock_app.api.backtesting.strategy import strategy_for
+from stock_app.api.data_utils.loading_utils import (
+    MARKETS,
+    execute_stock_q,
+    iter_stock_q,
+)
+from stock_app.api.data_utils.price_cube import (
+    SharedPriceCube,
+    attach_price_cube,
+    get_price_cube,
+)
+from stock_app.api.data_utils.trading_calendar import get_trading_calendar
+
+# Price column for the first letter of `value_1` and `value_2`
+COLUMN_MAP = {"O": "Open", "C": "Close", "L": "Low", "H": "High"}
+
+BACKTEST_ENGINE = os.environ.get("BACKTEST_ENGINE", "cube")
+BACKTEST_WORKERS = int(os.environ.get("BACKTEST_WORKERS", "1"))
+# Symbol x trading-day cells below which a backtest stays in-process
+PARALLEL_MIN_CELLS = 1_000_000
+# Trading days per window of the streaming engine
+STREAM_WINDOW_DAYS = 250
+# Price columns in the order the streaming engine reads them
+STREAM_COLUMNS = ["Open", "High", "Low", "Close"]
+# Units of the lag in a price term such as `O1`; the first is the default
+LAG_UNITS = ["calendar", "trading"]
+
+
+def universe_for(params):
+    """Read the symbols and market a backtest is restricted to.
+
+    Args:
+        params (dict): Backtest request fields `symbols`, a symbol or list
+            of symbols, and `market`, a key of `MARKETS`; both optional.
+
+    Returns:
+        tuple: Sorted tuple of symbols or None, and market name or None.
+
+    Raises:
+        ValueError: If either filter is malformed.
+    """
+    symbols = params.get("symbols")
+    if isinstance(symbols, str):
+        symbols = [symbols]
+    if symbols is not None:
+        if not isinstance(symbols, list) or not all(
+            isinstance(symbol, str) for symbol in symbols
+        ):
+            raise ValueError("symbols must be a symbol or list of symbols")
+        symbols = tuple(sorted(set(symbols)))
+    market = params.get("market")
+    if market is not None:
+        if not isinstance(market, str) or market.lower() not in MARKETS:
+            raise ValueError(f"market must be one of {', '.join(MARKETS)}")
+        market = market.lower()
+    return symbols, market
+
+
+def lag_unit_for(params):
+    """Read the unit of a backtest's price term lags.
+
+    Args:
+        params (dict): Backtest request fields, with an optional
+            `lag_unit` from `LAG_UNITS`.
+
+    Returns:
+        str: `calendar` or `trading`.
+
+    Raises:
+        ValueError: If the unit is unknown.
+    """
+    lag_unit = params.get("lag_unit") or LAG_UNITS[0]
+    if lag_unit not in LAG_UNITS:
+        raise ValueError(f"lag_unit must be one of {', '.join(LAG_UNITS)}")
+    return lag_unit
+
+
+def signal_mask(strategy, values):
+    """Find the days where a strategy holds.
+
+    Args:
+        strategy (Strategy or None): Compiled strategy; None matches no
+            days.
+        values (callable): Maps a price term such as `O1` to its values on
+            the trading days; `O0` and `C0` are the day's Open and Close.
+
+    Returns:
+        numpy.ndarray: Boolean mask over the trading days.
+    """
+    shape = values("O0").shape
+    if strategy is None:
+        return np.zeros(shape, dtype=bool)
+    return np.broadcast_to(strategy.evaluate(values), shape)
+
+
+def signal_day_totals(strategy, values, purchase_type, mask=None):
+    """Compute the daily P&L on the days where the strategy holds.
+
+    Buying (`B`) earns Close - Open and selling earns Open - Close.
+
+    Args:
+        strategy (Strategy or None): Compiled strategy; None matches no
+            days.
+        values (callable): Maps a price term to its values, as in
+            `signal_mask`.
+        purchase_type (str): `B` to buy, anything else to sell.
+        mask (numpy.ndarray, optional): The strategy's `signal_mask`, if
+            already computed.
+
+    Returns:
+        numpy.ndarray: P&L of each day the strategy held, in input order.
+    """
+    if mask is None:
+        mask = signal_mask(strategy, values)
+    open_ = values("O0")[mask]
+    close = values("C0")[mask]
+    return close - open_ if purchase_type == "B" else open_ - close
+
+
+def sum_day_totals(day_totals):
+    """Total the daily P&L of a backtest.
+
+    Args:
+        day_totals (numpy.ndarray): P&L of each day the signal held.
+
+    Returns:
+        tuple: Total return and number of observations.
+    """
+    if not day_totals.size:
+        return 0, 0
+    # cumsum adds strictly left to right, matching a running total exactly;
+    # sum() would use pairwise summation and can differ in the last bits
+    return float(np.cumsum(day_totals)[-1]), int(day_totals.size)
+
+
+def window_arrays(cube, params, cache):
+    """Return a function giving the flattened arrays of a backtest window.
+
+    Arrays are memoized in `cache` by window, lag unit and operand, so
+    backtests sharing a date range and lag reuse them. Trading-day lags
+    shift the cube's columns; calendar-day lags search for the day.
+
+    Args:
+        cube (PriceCube): Preloaded prices.
+        params (dict): Backtest request fields.
+        cache (dict): Arrays computed by earlier backtests.
+
+    Returns:
+        callable: Maps an operand such as `O1` to its values over the
+            window's present cells; `O0` and `C0` are the day's own Open
+            and Close.
+    """
+    columns = cube.window(params.get("start_date"), params.get("end_date"))
+    window = (columns.start, columns.stop)
+    if window not in cache:
+        cache[window] = cube.present[:, columns]
+    present = cache[window]
+    lag_unit = lag_unit_for(params)
+    lagged = cube.shifted if lag_unit == "trading" else cube.lagged
+
+    def values(operand):
+        key = (*window, lag_unit, operand)
+        if key not in cache:
+            column = COLUMN_MAP.get(operand[0])
+            prices = lagged(column, columns, int(operand[1:]))
+            # Boolean indexing flattens symbol by symbol, in date order
+            cache[key] = prices[present]
+        return cache[key]
+
+    return values
+
+
+def scoped_cube(cube, universe, cache):
+    """Restrict the cube to a universe, memoized in `cache`.
+
+    Args:
+        cube (PriceCube): Preloaded prices.
+        universe (tuple): Symbols and market from `universe_for`.
+        cache (dict): Scoped cubes computed by earlier backtests.
+
+    Returns:
+        tuple: The cube over the universe's symbols and the dict caching
+            its window arrays.
+    """
+    if universe not in cache:
+        symbols, market = universe
+        if symbols is None and market is None:
+            scoped = cube
+        else:
+            rows = cube.rows_for(symbols, MARKETS.get(market))
+            scoped = cube.partition(rows)
+        cache[universe] = (scoped, {})
+    return cache[universe]
+
+
+def backtest_day_totals(cube, params, cache=None):
+    """Run one backtest over a price cube.
+
+    For every symbol and trading day between `start_date` and
+    `end_date`, the request's strategy is evaluated on its price terms
+    (e.g. `O1`, the Open one day earlier in the request's `lag_unit`),
+    and the days where it holds are bought or sold according to
+    `purchase_type`.
+
+    Args:
+        cube (PriceCube): Prices of the symbols to backtest.
+        params (dict): Backtest request fields: `strategy`, or `value_1`,
+            `operator` and `value_2`, plus `purchase_type`, `start_date`
+            and `end_date`.
+        cache (dict, optional): Arrays shared between backtests run on the
+            same cube.
+
+    Returns:
+        numpy.ndarray: P&L of each day the signal held, symbol by symbol
+            in date order.
+    """
+    strategy = strategy_for(params)
+    values = window_arrays(cube, params, {} if cache is None else cache)
+    return signal_day_totals(strategy, values, params.get("purchase_type"))
+
+
+def run_backtest(cube, params, cache=None):
+    """Run one backtest in the calling thread.
+
+    The cube is first restricted to the request's `symbols` and `market`,
+    so lagged arrays are only built for those symbols.
+
+    Args:
+        cube (PriceCube): Preloaded prices.
+        params (dict): Backtest request fields.
+        cache (dict, optional): Scoped cubes and arrays shared between
+            backtests run on the same cube.
+
+    Returns:
+        tuple: Total return and number of observations, plus the
+            `BacktestBreakdown.as_dict()` description when the `detail`
+            field is set.
+    """
+    cache = {} if cache is None else cache
+    cube, arrays = scoped_cube(cube, universe_for(params), cache)
+    if params.get("detail"):
+        return detailed_backtest(cube, params, arrays)
+    return sum_day_totals(backtest_day_totals(cube, params, arrays))
+
+
+def detailed_backtest(cube, params, cache):
+    """Run one backtest and break its P&L down by symbol and day.
+
+    Args:
+        cube (PriceCube): Prices of the symbols to backtest.
+        params (dict): Backtest request fields.
+        cache (dict): Arrays shared between backtests run on the cube.
+
+    Returns:
+        tuple: Total return, number of observations and the
+            `BacktestBreakdown.as_dict()` description.
+    """
+    columns = cube.window(params.get("start_date"), params.get("end_date"))
+    values = window_arrays(cube, params, cache)
+    strategy = strategy_for(params)
+    mask = signal_mask(strategy, values)
+    day_totals = signal_day_totals(
+        strategy, values, params.get("purchase_type"), mask
+    )
+    # Row-major like the boolean indexing that flattened `values`
+    rows, cols = np.nonzero(cube.present[:, columns])
+    breakdown = BacktestBreakdown(cube.days[columns])
+    breakdown.add(
+        day_totals,
+        np.asarray(cube.symbols)[rows[mask]],
+        cube.days[columns][cols[mask]],
+    )
+    return (*sum_day_totals(day_totals), breakdown.as_dict())
+
+
+_worker_cube = None
+_worker_blocks = None
+
+
+def _init_worker(spec):
+    """Attach a pool worker to the shared price cube."""
+    global _worker_cube, _worker_blocks
+    _worker_cube, _worker_blocks = attach_price_cube(spec)
+
+
+def _partition_day_totals(rows, params):
+    """Run a backtest over one symbol partition in a pool worker."""
+    return backtest_day_totals(_worker_cube.partition(rows), params)
+
+
+_pool_lock = threading.Lock()
+_pool = None
+_shared = None
+_pool_pid = None
+
+
+def shutdown_backtest_pool():
+    """Stop the worker pool and remove its shared memory."""
+    global _pool, _shared
+    if _pool is not None and _pool_pid == os.getpid():
+        _pool.shutdown()
+        _shared.close()
+    _pool = None
+    _shared = None
+
+
+atexit.register(shutdown_backtest_pool)
+
+
+def _submit_partitions(cube, rows, params):
+    """Submit one task per symbol partition to a pool sharing `cube`.
+
+    `rows` selects the symbols to split, or None for all of them. The
+    pool and shared memory are recreated when the cube's data version
+    changes.
+    """
+    global _pool, _shared, _pool_pid
+    with _pool_lock:
+        if (
+            _pool is None
+            or _pool_pid != os.getpid()
+            or _shared.spec["version"] != cube.version
+        ):
+            shutdown_backtest_pool()
+            _shared = SharedPriceCube(cube)
+            _pool = ProcessPoolExecutor(
+                max_workers=BACKTEST_WORKERS,
+                mp_context=get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(_shared.spec,),
+            )
+            _pool_pid = os.getpid()
+        if rows is None:
+            bounds = np.linspace(
+                0, len(cube.symbols), BACKTEST_WORKERS + 1, dtype=int
+            )
+            partitions = [slice(a, b) for a, b in pairwise(bounds)]
+        else:
+            partitions = np.array_split(rows, BACKTEST_WORKERS)
+        return [
+            _pool.submit(_partition_day_totals, partition, params)
+            for partition in partitions
+        ]
+
+
+def run_backtest_parallel(cube, params, rows=None):
+    """Run one backtest split by symbol across the worker pool.
+
+    Workers return their partition's daily P&L rather than a partial sum;
+    the partitions are concatenated in symbol order and totalled here, so
+    the result is identical to `run_backtest`.
+
+    Args:
+        cube (PriceCube): Preloaded prices.
+        params (dict): Backtest request fields.
+        rows (numpy.ndarray, optional): Ascending rows of the symbols in
+            the request's universe; all symbols if omitted.
+
+    Returns:
+        tuple: Total return and number of observations.
+    """
+    futures = _submit_partitions(cube, rows, params)
+    return sum_day_totals(
+        np.concatenate([future.result() for future in futures])
+    )
+
+
+def _read_stream_rows(first_day, last_day, universe):
+    """Read the prices between two day numbers, inclusive.
+
+    The universe's symbol and market filters are applied in the query.
+
+    Returns:
+        tuple: Sorted int64 keys (symbol ID and day) and a float64 array
+            of `STREAM_COLUMNS` prices per key.
+    """
+    symbols, market = universe
+    conditions = ["day BETWEEN ? AND ?"]
+    parameters = [first_day, last_day]
+    if symbols is not None:
+        placeholders = ", ".join("?" * len(symbols))
+        conditions.append(
+            f"symbol_id IN (SELECT id FROM symbols "
+            f"WHERE Symbol IN ({placeholders}))"
+        )
+        parameters.extend(symbols)
+    if market is not None:
+        conditions.append("market_id = ?")
+        parameters.append(MARKETS[market])
+    query = f"""
+        SELECT symbol_id, day, {", ".join(STREAM_COLUMNS)}
+        FROM prices
+        WHERE {" AND ".join(conditions)}
+    """
+    batches = [
+        np.array(batch, dtype=float)
+        for batch in iter_stock_q(query, parameters, row_factory=False)
+    ]
+    rows = (
+        np.concatenate(batches)
+        if batches
+        else np.empty((0, len(STREAM_COLUMNS) + 2))
+    )
+    keys = stream_key(rows[:, 0].astype(np.int64), rows[:, 1].astype(np.int64))
+    order = np.argsort(keys, kind="stable")
+    return keys[order], rows[order, 2:]
+
+
+def stream_key(symbol_ids, days):
+    """Combine symbol IDs and day numbers into sortable int64 keys."""
+    return symbol_ids * (1 << 32) + days
+
+
+def _lookup(keys, prices, wanted, column):
+    """Return the prices of `wanted` keys in one column, NaN if missing."""
+    if not len(keys):
+        return np.full(len(wanted), np.nan)
+    positions = np.minimum(np.searchsorted(keys, wanted), len(keys) - 1)
+    values = prices[positions, column]
+    return np.where(keys[positions] == wanted, values, np.nan)
+
+
+def lag_shift(calendar, lag_unit):
+    """Return a function moving day numbers back by a lag.
+
+    Args:
+        calendar (TradingCalendar): Current trading calendar.
+        lag_unit (str): Unit of the lag, from `LAG_UNITS`.
+
+    Returns:
+        callable: Maps day numbers, which must be trading days for the
+            `trading` unit, and a lag to the lagged day numbers. Lags
+            reaching before the calendar give a day without prices.
+    """
+    if lag_unit != "trading":
+        return lambda days, lag: days - lag
+    trading_days = np.asarray(calendar.days, dtype=np.int64)
+
+    def shift(days, lag):
+        positions = np.searchsorted(trading_days, days) - lag
+        lagged = trading_days[np.maximum(positions, 0)]
+        return np.where(positions >= 0, lagged, trading_days[0] - 1)
+
+    return shift
+
+
+def _stream_values(keys, prices, symbol_ids, target_days, shift):
+    """Return a memoized term lookup over the rows of one window."""
+    cache = {}
+
+    def values(term):
+        if term not in cache:
+            column = STREAM_COLUMNS.index(COLUMN_MAP[term[0]])
+            wanted = stream_key(symbol_ids, shift(target_days, int(term[1:])))
+            cache[term] = _lookup(keys, prices, wanted, column)
+        return cache[term]
+
+    return values
+
+
+def _symbol_names():
+    """Return an array mapping symbol IDs to symbols."""
+    rows = execute_stock_q("SELECT id, Symbol FROM symbols")
+    names = np.empty(max((row[0] for row in rows), default=0) + 1, object)
+    for symbol_id, symbol in rows:
+        names[symbol_id] = symbol
+    return names
+
+
+def run_backtest_streaming(
+    params, window_days=STREAM_WINDOW_DAYS, calendar=None
+):
+    """Run one backtest reading prices window by window from the database.
+
+    Each window covers `window_days` trading days. Rows older than the
+    longest lag before the next window are dropped, so only that lag
+    buffer is carried over; with trading-day lags the buffer is measured
+    in trading days. Totals and observation counts are summed
+    window by window; days are added in window, symbol ID and date
+    order, so a total can differ from `run_backtest` in its last bits.
+
+    Args:
+        params (dict): Backtest request fields with valid dates.
+        window_days (int): Trading days per window.
+        calendar (TradingCalendar, optional): Calendar to run on; defaults
+            to the current trading calendar.
+
+    With the `detail` field set, the per-symbol and daily breakdown is
+    accumulated window by window too.
+
+    Returns:
+        tuple: Total return and number of observations, plus the
+            `BacktestBreakdown.as_dict()` description when `detail` is set.
+    """
+    if calendar is None:
+        calendar = get_trading_calendar()
+    start = calendar.position(params.get("start_date"))
+    end = calendar.position(params.get("end_date"))
+    strategy = strategy_for(params)
+    breakdown = None
+    if params.get("detail"):
+        breakdown = BacktestBreakdown(calendar.days[start : end + 1])
+        names = _symbol_names()
+    if strategy is None:
+        return (0, 0) if breakdown is None else (0, 0, breakdown.as_dict())
+    max_lag = max((int(term[1:]) for term in strategy.terms), default=0)
+    universe = universe_for(params)
+    shift = lag_shift(calendar, lag_unit_for(params))
+
+    total = 0
+    num_observations = 0
+    keys = np.empty(0, dtype=np.int64)
+    prices = np.empty((0, len(STREAM_COLUMNS)))
+    loaded_until = None
+    for window_start in range(start, end + 1, window_days):
+        first_day = calendar.days[window_start]
+        last_day = calendar.days[min(window_start + window_days, end + 1) - 1]
+
+        # Drop rows no lag in this window can reach, then read new days
+        oldest_day = int(shift(first_day, max_lag))
+        keep = keys % (1 << 32) >= oldest_day
+        new_keys, new_prices = _read_stream_rows(
+            oldest_day if loaded_until is None else loaded_until + 1,
+            last_day,
+            universe,
+        )
+        keys = np.concatenate([keys[keep], new_keys])
+        prices = np.concatenate([prices[keep], new_prices])
+        order = np.argsort(keys, kind="stable")
+        keys, prices = keys[order], prices[order]
+        loaded_until = last_day
+
+        days = keys % (1 << 32)
+        in_window = (days >= first_day) & (days <= last_day)
+        symbol_ids = keys[in_window] // (1 << 32)
+        values = _stream_values(
+            keys, prices, symbol_ids, days[in_window], shift
+        )
+        mask = signal_mask(strategy, values)
+        day_totals = signal_day_totals(
+            strategy, values, params.get("purchase_type"), mask
+        )
+        if day_totals.size:
+            total = float(np.cumsum(np.concatenate([[total], day_totals]))[-1])
+            num_observations += int(day_totals.size)
+        if breakdown is not None:
+            breakdown.add(
+                day_totals,
+                names[symbol_ids[mask]],
+                days[in_window][mask],
+            )
+    if breakdown is not None:
+        return total, num_observations, breakdown.as_dict()
+    return total, num_observations
+
+
+def batch_runner():
+    """Return a function running the backtests of one batch.
+
+    With the cube engine the batch shares one cube and its lagged arrays.
+
+    Returns:
+        callable: Maps backtest request fields to the data version the
+            backtest ran at and its total return and number of
+            observations.
+    """
+    if BACKTEST_ENGINE == "stream":
+        return evaluate_backtest
+    cube = get_price_cube()
+    cache = {}
+    return lambda params: (cube.version, run_backtest(cube, params, cache))
+
+
+def evaluate_backtest(params):
+    """Run one backtest with the configured engine.
+
+    With the cube engine the backtest runs in parallel when the window is
+    large enough, unless the `detail` breakdown is requested.
+
+    Args:
+        params (dict): Backtest request fields with valid dates.
+
+    Returns:
+        tuple: (version, result) where `version` is the data version the
+            backtest ran at and `result` the total return and number of
+            observations, plus the `BacktestBreakdown.as_dict()`
+            description when `detail` is set.
+    """
+    if BACKTEST_ENGINE == "stream":
+        calendar = get_trading_calendar()
+        return calendar.version, run_backtest_streaming(
+            params, calendar=calendar
+        )
+    cube = get_price_cube()
+    symbols, market = universe_for(params)
+    rows = None
+    if symbols is not None or market is not None:
+        rows = cube.rows_for(symbols, MARKETS.get(market))
+    columns = cube.window(params.get("start_date"), params.get("end_date"))
+    num_symbols = len(cube.symbols) if rows is None else len(rows)
+    cells = num_symbols * len(cube.days[columns])
+    parallel = BACKTEST_WORKERS > 1 and cells >= PARALLEL_MIN_CELLS
+    if parallel and not params.get("detail"):
+        return cube.version, run_backtest_parallel(cube, params, rows)
+    return cube.version, run_backtest(cube, params)
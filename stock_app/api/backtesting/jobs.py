@@ -0,0 +1,198 @@
+"""Run long backtests as background jobs that clients poll.
+
+Jobs are executed by a bounded thread pool. Finished jobs keep their
+result for `BACKTEST_JOB_TTL` seconds and are then forgotten.
+"""
+
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from stock_app.api.logger_utils.custom_logger import custom_logger
+
+BACKTEST_JOB_WORKERS = int(os.environ.get("BACKTEST_JOB_WORKERS", "2"))
+BACKTEST_JOB_TTL = float(os.environ.get("BACKTEST_JOB_TTL", "3600"))
+MAX_PENDING_JOBS = 100
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class QueueFullError(RuntimeError):
+    """Raised when too many jobs are waiting to run."""
+
+
+def _timestamp(seconds):
+    """Format a `time.time()` value as an ISO 8601 UTC string, or None."""
+    if seconds is None:
+        return None
+    return datetime.fromtimestamp(seconds, timezone.utc).isoformat()
+
+
+class JobQueue:
+    """Bounded pool of background jobs with results kept for a TTL."""
+
+    def __init__(
+        self,
+        workers=BACKTEST_JOB_WORKERS,
+        ttl=BACKTEST_JOB_TTL,
+        max_pending=MAX_PENDING_JOBS,
+    ):
+        """Create the queue; worker threads start with the first job.
+
+        Args:
+            workers (int): Jobs run at the same time.
+            ttl (float): Seconds a finished job is kept.
+            max_pending (int): Most jobs waiting to start.
+        """
+        self.ttl = ttl
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="backtest-job"
+        )
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._completed = 0
+        self._failed = 0
+        self._expired = 0
+        self._total_runtime = 0.0
+        self._max_runtime = 0.0
+        self._total_wait = 0.0
+
+    def submit(self, task, *args):
+        """Queue `task(*args)` to run in the background.
+
+        Args:
+            task (callable): Function computing the job's result.
+            *args: Arguments for `task`.
+
+        Returns:
+            str: ID of the new job.
+
+        Raises:
+            QueueFullError: If `max_pending` jobs are already waiting.
+        """
+        self._purge_expired()
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            pending = sum(
+                job["status"] == QUEUED for job in self._jobs.values()
+            )
+            if pending >= self.max_pending:
+                raise QueueFullError(f"{pending} jobs are already queued")
+            self._jobs[job_id] = {
+                "status": QUEUED,
+                "submitted_at": time.time(),
+                "started_at": None,
+                "finished_at": None,
+                "result": None,
+                "error": None,
+            }
+        self._executor.submit(self._run, job_id, task, args)
+        return job_id
+
+    def _run(self, job_id, task, args):
+        """Execute a job and store its outcome."""
+        with self._lock:
+            job = self._jobs[job_id]
+            job["status"] = RUNNING
+            job["started_at"] = time.time()
+            self._total_wait += job["started_at"] - job["submitted_at"]
+        try:
+            result, error, status = task(*args), None, DONE
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            custom_logger.error(f"Backtest job {job_id} failed: {error}")
+            result, status = None, FAILED
+        with self._lock:
+            job.update(
+                status=status,
+                result=result,
+                error=error,
+                finished_at=time.time(),
+            )
+            runtime = job["finished_at"] - job["started_at"]
+            self._total_runtime += runtime
+            self._max_runtime = max(self._max_runtime, runtime)
+            if status == DONE:
+                self._completed += 1
+            else:
+                self._failed += 1
+
+    def _purge_expired(self):
+        """Forget finished jobs older than the TTL."""
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            expired = [
+                job_id
+                for job_id, job in self._jobs.items()
+                if job["finished_at"] is not None
+                and job["finished_at"] < cutoff
+            ]
+            for job_id in expired:
+                del self._jobs[job_id]
+            self._expired += len(expired)
+
+    def get(self, job_id):
+        """Describe a job.
+
+        Args:
+            job_id (str): ID returned by `submit`.
+
+        Returns:
+            dict or None: Status, timestamps, and the result or error once
+                finished; None if the job is unknown or expired.
+        """
+        self._purge_expired()
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            job = dict(job)
+        description = {
+            "job_id": job_id,
+            "status": job["status"],
+            "submitted_at": _timestamp(job["submitted_at"]),
+            "started_at": _timestamp(job["started_at"]),
+            "finished_at": _timestamp(job["finished_at"]),
+        }
+        if job["status"] == DONE:
+            description["result"] = job["result"]
+        elif job["status"] == FAILED:
+            description["error"] = job["error"]
+        return description
+
+    def metrics(self):
+        """Report queue depth and runtime statistics.
+
+        Returns:
+            dict: Queued and running jobs, completed, failed and expired
+                counts, and mean wait and mean/max runtime in seconds.
+        """
+        self._purge_expired()
+        with self._lock:
+            statuses = [job["status"] for job in self._jobs.values()]
+            finished = self._completed + self._failed
+            started = finished + statuses.count(RUNNING)
+            return {
+                "queued": statuses.count(QUEUED),
+                "running": statuses.count(RUNNING),
+                "completed": self._completed,
+                "failed": self._failed,
+                "expired": self._expired,
+                "mean_wait_seconds": (
+                    self._total_wait / started if started else 0.0
+                ),
+                "mean_runtime_seconds": (
+                    self._total_runtime / finished if finished else 0.0
+                ),
+                "max_runtime_seconds": self._max_runtime,
+            }
+
+
+backtest_jobs = JobQueue()
@@ -0,0 +1,152 @@
+"""Cache backtest results by their canonical parameters.
+
+Entries are keyed by the data version and the canonicalized request
+fields, so equivalent requests share a result and a data load makes every
+earlier entry unreachable. Results are stored under the version they were
+computed at, and the cache only moves to newer versions, so a request
+still holding an older calendar never drops newer entries. The cache
+keeps the `BACKTEST_CACHE_SIZE` most recently used results.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+from stock_app.api.backtesting.engine import lag_unit_for, universe_for
+from stock_app.api.backtesting.strategy import strategy_for
+
+BACKTEST_CACHE_SIZE = int(os.environ.get("BACKTEST_CACHE_SIZE", "1024"))
+
+
+def canonical_params(params):
+    """Build the cache key fields of a backtest request.
+
+    The strategy is keyed by its canonical text, so a legacy comparison
+    and the equivalent `strategy` expression share an entry, and the
+    symbols filter by its sorted, de-duplicated symbols.
+
+    Args:
+        params (dict): Backtest request fields.
+
+    Returns:
+        tuple or None: Canonical field values, or None if the request
+            cannot be cached.
+    """
+    try:
+        strategy = strategy_for(params)
+        symbols, market = universe_for(params)
+        lag_unit = lag_unit_for(params)
+    except ValueError:
+        return None
+    if strategy is None:
+        return None
+    # Any purchase type other than a buy is evaluated as a sell
+    purchase_type = "B" if params.get("purchase_type") == "B" else "S"
+    return (
+        strategy.text,
+        purchase_type,
+        params.get("start_date"),
+        params.get("end_date"),
+        symbols,
+        market,
+        lag_unit,
+        bool(params.get("detail")),
+    )
+
+
+class ResultCache:
+    """Thread-safe LRU cache of backtest results."""
+
+    def __init__(self, maxsize=BACKTEST_CACHE_SIZE):
+        """Create an empty cache.
+
+        Args:
+            maxsize (int): Most results kept.
+        """
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+
+    def _sync_version(self, version):
+        """Drop every entry when a newer data version is seen.
+
+        Args:
+            version (int): Data version of a lookup or a computed result.
+
+        Returns:
+            bool: Whether `version` is the version of the cached entries.
+        """
+        if self._version is None or version > self._version:
+            if self._entries:
+                self._invalidations += 1
+            self._entries.clear()
+            self._version = version
+        return version == self._version
+
+    def get_or_compute(self, version, params, compute):
+        """Return the cached result for `params`, computing it on a miss.
+
+        Args:
+            version (int): Data version the request was validated at.
+            params (dict): Backtest request fields.
+            compute (callable): Computes the result when it is not cached,
+                returning the data version it ran at and the result.
+
+        Returns:
+            The cached or newly computed result.
+        """
+        key = canonical_params(params)
+        if key is None:
+            return compute()[1]
+        with self._lock:
+            if self._sync_version(version) and key in self._entries:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return self._entries[key]
+            self._misses += 1
+
+        version, result = compute()
+        with self._lock:
+            if not self._sync_version(version):
+                # Newer data was cached while computing; keep those entries
+                return result
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+        return result
+
+    def clear(self):
+        """Drop every entry and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self._hits = self._misses = 0
+            self._evictions = self._invalidations = 0
+
+    def stats(self):
+        """Report cache usage.
+
+        Returns:
+            dict: Size, hits, misses, hit rate, evictions, and how often a
+                data load invalidated the cache.
+        """
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+                "evictions": self._evictions,
+                "invalidations": self._invalidations,
+            }
+
+
+backtest_cache = ResultCache()
@@ -4,135 +4,317 @@ This module provides API routes for validating stock data,
 performing computations, and responding to requests with results.
 """
 
-import sqlite3
-from datetime import datetime, timedelta
+import json
+from functools import partial
+from itertools import islice, product
 
-import pandas as pd
 from flask import Response, jsonify, request
 
-from stock_app.api.data_utils.loading_utils import execute_stock_q
+from stock_app.api.backtesting.engine import (
+    batch_runner,
+    evaluate_backtest,
+    lag_unit_for,
+    universe_for,
+)
+from stock_app.api.backtesting.jobs import (
+    DONE,
+    FAILED,
+    QUEUED,
+    QueueFullError,
+    backtest_jobs,
+)
+from stock_app.api.backtesting.result_cache import backtest_cache
+from stock_app.api.backtesting.strategy import strategy_for
+from stock_app.api.data_utils.trading_calendar import get_trading_calendar
 from stock_app.api.route_utils.decorators import (
     authenticate_request,
     log_route,
 )
 
+BACKTEST_FIELDS = [
+    "strategy",
+    "value_1",
+    "value_2",
+    "operator",
+    "purchase_type",
+    "start_date",
+    "end_date",
+    "symbols",
+    "market",
+    "lag_unit",
+]
+MAX_BATCH_SIZE = 1000
+
+
+def has_trading_dates(calendar, params):
+    """Check that a backtest starts and ends on trading days.
+
+    Args:
+        calendar (TradingCalendar): Current trading calendar.
+        params (dict): Backtest request fields.
+
+    Returns:
+        bool: True if both `start_date` and `end_date` are trading days.
+    """
+    start_date = params.get("start_date")  # Format: '%Y-%m-%d'
+    end_date = params.get("end_date")  # Format: '%Y-%m-%d'
+    start_date_in_stock = calendar.is_trading_day(start_date)
+    end_date_in_stock = calendar.is_trading_day(end_date)
+    return start_date_in_stock and end_date_in_stock
+
+
+def params_error(params):
+    """Describe why a backtest's strategy, universe or lag unit is invalid.
+
+    Args:
+        params (dict): Backtest request fields.
+
+    Returns:
+        str or None: Error message, or None if all are valid.
+    """
+    try:
+        strategy_for(params)
+        universe_for(params)
+        lag_unit_for(params)
+    except ValueError as e:
+        return str(e)
+    return None
+
+
+def compute_backtest(calendar, params):
+    """Run a backtest whose dates were validated, using cached results.
+
+    Args:
+        calendar (TradingCalendar): Calendar the dates were validated
+            against; cached results of its data version are reused.
+        params (dict): Backtest request fields.
+
+    Returns:
+        dict: Rounded `return` and `num_observations`, plus `symbols` and
+            `equity_curve` when the `detail` field is set.
+    """
+    total, num_observations, *breakdown = backtest_cache.get_or_compute(
+        calendar.version, params, partial(evaluate_backtest, params)
+    )
+    result = {
+        "return": round(total, 2),
+        "num_observations": int(num_observations),
+    }
+    if breakdown:
+        result.update(breakdown[0])
+    return result
+
+
+def ndjson_lines(result):
+    """Serialize a detailed backtest result as NDJSON lines.
+
+    The first line holds the totals, followed by one line per symbol and
+    one per equity curve point, each tagged with its `type`.
+
+    Args:
+        result (dict): Result of `compute_backtest` with `detail` set.
+
+    Yields:
+        str: One JSON document per line.
+    """
+    yield (
+        json.dumps(
+            {
+                "type": "summary",
+                "return": result["return"],
+                "num_observations": result["num_observations"],
+            }
+        )
+        + "\n"
+    )
+    for row in result["symbols"]:
+        yield json.dumps({"type": "symbol", **row}) + "\n"
+    for point in result["equity_curve"]:
+        yield json.dumps({"type": "equity", **point}) + "\n"
+
+
+def expand_param_grid(grid, limit=None):
+    """Expand a parameter grid into every combination of its values.
+
+    Combinations are generated lazily, so a huge grid costs no more than
+    `limit` parameter sets.
+
+    Args:
+        grid (dict): Backtest fields mapped to a value or a list of values.
+        limit (int, optional): Most parameter sets to expand.
+
+    Returns:
+        list[dict]: One parameter set per combination, at most `limit`.
+    """
+    options = [
+        value if isinstance(value, list) else [value]
+        for value in (grid.get(field) for field in BACKTEST_FIELDS)
+    ]
+    return [
+        dict(zip(BACKTEST_FIELDS, combination, strict=True))
+        for combination in islice(product(*options), limit)
+    ]
+
+
+def batch_result(calendar, params, run):
+    """Run one backtest of a batch and describe its outcome.
+
+    Args:
+        calendar (TradingCalendar): Current trading calendar.
+        params (dict): Backtest request fields.
+        run (callable): Batch runner from `engine.batch_runner`.
+
+    Returns:
+        dict: The parameters with either `return` and `num_observations`
+            or an `error` message.
+    """
+    if not isinstance(params, dict):
+        return {"params": params, "error": "Invalid parameters"}
+    # Only the batch fields are used, so `detail` is ignored in batches
+    params = {field: params.get(field) for field in BACKTEST_FIELDS}
+    result = {"params": params}
+
+    if not has_trading_dates(calendar, params):
+        result["error"] = "Invalid date"
+        return result
+    error = params_error(params)
+    if error is not None:
+        result["error"] = error
+        return result
+
+    try:
+        total, num_observations = backtest_cache.get_or_compute(
+            calendar.version, params, partial(run, params)
+        )
+    except (KeyError, TypeError, ValueError, IndexError):
+        result["error"] = "Invalid parameters"
+        return result
+    result["return"] = round(total, 2)
+    result["num_observations"] = int(num_observations)
+    return result
+
+
+def wants_ndjson():
+    """Check whether the client prefers NDJSON over JSON."""
+    best = request.accept_mimetypes.best_match(
+        ["application/json", "application/x-ndjson"]
+    )
+    return best == "application/x-ndjson"
+
+
+def calc_backtest_batch():
+    """Run many backtests on one load of the price data.
+
+    The JSON body holds either `params`, a list of backtest requests, or
+    `grid`, whose fields are values or lists of values to combine. Every
+    parameter set gets a result in request order; invalid ones get an
+    `error` instead of a return.
+
+    Returns:
+        Response: JSON response with a `results` list.
+    """
+    data = request.get_json(silent=True) or {}
+    if isinstance(data.get("grid"), dict):
+        # One more than allowed is enough to reject an oversized grid
+        param_sets = expand_param_grid(data["grid"], MAX_BATCH_SIZE + 1)
+    elif isinstance(data.get("params"), list):
+        param_sets = data["params"]
+    else:
+        return jsonify({"error": "Expected 'params' or 'grid'"}), 400
+    if len(param_sets) > MAX_BATCH_SIZE:
+        return jsonify(
+            {"error": f"At most {MAX_BATCH_SIZE} parameter sets allowed"}
+        ), 400
+
+    calendar = get_trading_calendar()
+    run = batch_runner()
+    results = [batch_result(calendar, params, run) for params in param_sets]
+    return jsonify({"results": results})
+
 
 def calc_backtest():
     """Perform backtesting calculations based on JSON request data.
 
+    With the `detail` field set, the response also breaks the return down
+    by symbol and by day, and is streamed as NDJSON when the client
+    accepts `application/x-ndjson`.
+
     Returns:
         Response: JSON response with total returns and number of observations.
     """
     # Parse JSON request data
     data = request.get_json()
-    value_1 = data.get("value_1")
-    value_2 = data.get("value_2")
-    operator = data.get("operator")
-    purchase_type = data.get("purchase_type")
-    start_date = data.get("start_date")  # Format: '%Y-%m-%d'
-    end_date = data.get("end_date")  # Format: '%Y-%m-%d'
 
     # Validate start and end dates
-    date_validation_query = "SELECT Date FROM stocks WHERE Date = ?"
-    start_date_in_stock = execute_stock_q(
-        date_validation_query, (start_date,), fetch_all=False
-    )
-    end_date_in_stock = execute_stock_q(
-        date_validation_query, (end_date,), fetch_all=False
-    )
+    calendar = get_trading_calendar()
+    if not has_trading_dates(calendar, data):
+        return Response(status=400)
+    error = params_error(data)
+    if error is not None:
+        return jsonify({"error": error}), 400
+
+    result = compute_backtest(calendar, data)
+    if data.get("detail") and wants_ndjson():
+        return Response(ndjson_lines(result), mimetype="application/x-ndjson")
+    return jsonify(result)
+
 
-    if not start_date_in_stock or not end_date_in_stock:
+def submit_backtest_job():
+    """Queue a backtest to run in the background.
+
+    Returns:
+        Response: 202 with the job ID, 400 for invalid dates or
+            parameters, or 503 when the job queue is full.
+    """
+    data = request.get_json()
+
+    calendar = get_trading_calendar()
+    if not has_trading_dates(calendar, data):
         return Response(status=400)
+    error = params_error(data)
+    if error is not None:
+        return jsonify({"error": error}), 400
+
+    try:
+        job_id = backtest_jobs.submit(compute_backtest, calendar, data)
+    except QueueFullError as e:
+        return jsonify({"error": str(e)}), 503
+    return jsonify({"job_id": job_id, "status": QUEUED}), 202
+
+
+def get_backtest_job(job_id):
+    """Report the status of a backtest job.
+
+    Args:
+        job_id (str): ID returned when the job was submitted.
 
-    # Column mapping
-    column_map = {"O": "Open", "C": "Close", "L": "Low", "H": "High"}
-    col_one = column_map.get(value_1[0])
-    col_two = column_map.get(value_2[0])
-
-    # Calculate back days
-    back_val_one = int(value_1[1:])
-    back_val_two = int(value_2[1:])
-    back_target = max(back_val_one, back_val_two)
-    back_day = (
-        datetime.strptime(start_date, "%Y-%m-%d") - timedelta(days=back_target)
-    ).strftime("%Y-%m-%d")
-
-    # Query data from the database
-    query = """
-    SELECT *
-    FROM stocks
-    WHERE Date BETWEEN ? AND ?
+    Returns:
+        Response: JSON job description, or 404 for unknown jobs.
     """
-    conn = sqlite3.connect("/app/src/data/stocks.db")
-    cursor = conn.cursor()
-    cursor.execute(query, (back_day, end_date))
-    results = cursor.fetchall()
-    headers = [description[0] for description in cursor.description]
-    stock_range_df = pd.DataFrame(results, columns=headers)
-    conn.close()
-
-    # Filter data for unique symbols and valid date range
-    stock_range_df["Date"] = pd.to_datetime(stock_range_df["Date"])
-    stock_range_df = stock_range_df.sort_values(by=["Symbol", "Date"])
-
-    # Initialize totals
-    total = 0
-    num_observations = 0
-
-    # Precompute shifted values for back days
-    stock_range_df["val_one_day"] = stock_range_df["Date"] - pd.to_timedelta(
-        back_val_one, unit="D"
-    )
-    stock_range_df["val_two_day"] = stock_range_df["Date"] - pd.to_timedelta(
-        back_val_two, unit="D"
-    )
+    job = backtest_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job), 200
 
-    # Merge to get lagged data for value_1 and value_2
-    val_one_df = stock_range_df[["Symbol", "Date", col_one]].rename(
-        columns={"Date": "val_one_day", col_one: "val_one_target"}
-    )
-    val_two_df = stock_range_df[["Symbol", "Date", col_two]].rename(
-        columns={"Date": "val_two_day", col_two: "val_two_target"}
-    )
-    merged_df = stock_range_df.merge(
-        val_one_df, on=["Symbol", "val_one_day"], how="left"
-    ).merge(val_two_df, on=["Symbol", "val_two_day"], how="left")
-
-    # Filter for valid start-to-end date range
-    start_to_end = pd.date_range(start=start_date, end=end_date)
-    merged_df = merged_df[merged_df["Date"].isin(start_to_end)]
-
-    # Apply conditions and calculate totals
-    for _, row in merged_df.iterrows():
-        if pd.isna(row["val_one_target"]) or pd.isna(row["val_two_target"]):
-            continue
-
-        if operator == "LT" and row["val_one_target"] < row["val_two_target"]:
-            day_total = (
-                row["Close"] - row["Open"]
-                if purchase_type == "B"
-                else row["Open"] - row["Close"]
-            )
-            total += day_total
-            num_observations += 1
-        elif (
-            operator == "LTE"
-            and row["val_one_target"] <= row["val_two_target"]
-        ):
-            day_total = (
-                row["Close"] - row["Open"]
-                if purchase_type == "B"
-                else row["Open"] - row["Close"]
-            )
-            total += day_total
-            num_observations += 1
-
-    return jsonify(
-        {
-            "return": round(total, 2),
-            "num_observations": int(num_observations),
-        }
-    )
+
+def get_backtest_job_result(job_id):
+    """Return the result of a finished backtest job.
+
+    Args:
+        job_id (str): ID returned when the job was submitted.
+
+    Returns:
+        Response: 200 with the backtest result, 202 while the job is
+            pending, 500 if it failed, or 404 for unknown jobs.
+    """
+    job = backtest_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    if job["status"] == DONE:
+        return jsonify(job["result"]), 200
+    if job["status"] == FAILED:
+        return jsonify({"error": job["error"]}), 500
+    return jsonify({"job_id": job_id, "status": job["status"]}), 202
 
 
 def register_routes4(app):
@@ -152,3 +334,49 @@ def register_routes4(app):
             Response: JSON response with calculation results or error messages.
         """
         return calc_backtest()
+
+    @app.route("/api/v4/back_test/batch", methods=["POST"])
+    @log_route
+    @authenticate_request
+    def back_test_batch():
+        """Handle batch backtesting API requests.
+
+        Returns:
+            Response: JSON response with one result per parameter set.
+        """
+        return calc_backtest_batch()
+
+    @app.route("/api/v4/back_test/jobs", methods=["POST"])
+    @log_route
+    @authenticate_request
+    def back_test_job_submit():
+        """Queue an asynchronous backtest."""
+        return submit_backtest_job()
+
+    @app.route("/api/v4/back_test/jobs/metrics", methods=["GET"])
+    @log_route
+    @authenticate_request
+    def back_test_job_metrics():
+        """Report backtest job queue depth and runtimes."""
+        return jsonify(backtest_jobs.metrics())
+
+    @app.route("/api/v4/back_test/cache/metrics", methods=["GET"])
+    @log_route
+    @authenticate_request
+    def back_test_cache_metrics():
+        """Report backtest result cache hit rates."""
+        return jsonify(backtest_cache.stats())
+
+    @app.route("/api/v4/back_test/jobs/<job_id>", methods=["GET"])
+    @log_route
+    @authenticate_request
+    def back_test_job_status(job_id):
+        """Report the status of a backtest job."""
+        return get_backtest_job(job_id)
+
+    @app.route("/api/v4/back_test/jobs/<job_id>/result", methods=["GET"])
+    @log_route
+    @authenticate_request
+    def back_test_job_result(job_id):
+        """Return the result of a backtest job."""
+        return get_backtest_job_result(job_id)
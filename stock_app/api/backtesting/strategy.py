@@ -0,0 +1,364 @@
+"""Parse and compile backtest strategy expressions.
+
+A strategy is a boolean expression over price terms, for example
+`C1 - O1 > 0 AND (H2 >= L1 OR NOT O3 == C3)`. A term is a price letter
+(`O`, `H`, `L` or `C`) followed by a lag in calendar or trading days,
+depending on the request's `lag_unit`. Terms combine with numbers
+through `+ - * /`, compare through `< <= > >= == !=`, and conditions
+combine through `AND`, `OR` and `NOT`.
+
+Expressions are parsed once, compiled to vectorized numpy operations and
+cached by their text. A day only matches when every term the strategy
+references has a price on it.
+"""
+
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+import numpy as np
+
+# Comparison operators accepted in the legacy `operator` request field
+LEGACY_OPERATORS = {
+    "LT": "<",
+    "LTE": "<=",
+    "GT": ">",
+    "GTE": ">=",
+    "EQ": "==",
+}
+COMPARISONS = {
+    "<": np.less,
+    "<=": np.less_equal,
+    ">": np.greater,
+    ">=": np.greater_equal,
+    "==": np.equal,
+    "!=": np.not_equal,
+}
+ARITHMETIC = {
+    "+": np.add,
+    "-": np.subtract,
+    "*": np.multiply,
+    "/": np.divide,
+}
+MAX_STRATEGY_LENGTH = 1000
+
+_TOKEN_RE = re.compile(
+    r"\s*(?:(?P<number>\d+(?:\.\d*)?|\.\d+)"
+    r"|(?P<term>[OHLC]\d+)\b"
+    r"|(?P<word>AND|OR|NOT)\b"
+    r"|(?P<op><=|>=|==|!=|[<>+\-*/()]))",
+    re.IGNORECASE,
+)
+
+Strategy = namedtuple("Strategy", ["text", "terms", "evaluate"])
+Strategy.__doc__ = """Compiled strategy.
+
+Attributes:
+    text (str): Canonical, fully parenthesized expression.
+    terms (tuple[str]): Canonical price terms it references, e.g. `O1`.
+    evaluate (callable): Maps a function returning each term's values to
+        the boolean array of matching days.
+"""
+
+
+class StrategyError(ValueError):
+    """Raised for a strategy expression that cannot be compiled."""
+
+
+def canonical_term(term):
+    """Canonicalize a price term such as `o01` to `O1`.
+
+    Args:
+        term (str): Price letter followed by a lag.
+
+    Returns:
+        str: Canonical term.
+
+    Raises:
+        StrategyError: If the term is malformed.
+    """
+    if not isinstance(term, str) or not re.fullmatch(
+        r"[OHLC]\d+", term, re.IGNORECASE
+    ):
+        raise StrategyError(f"Invalid price term: {term!r}")
+    return f"{term[0].upper()}{int(term[1:])}"
+
+
+def tokenize(text):
+    """Split an expression into `(kind, value)` tokens.
+
+    Raises:
+        StrategyError: On characters that do not form a token.
+    """
+    tokens = []
+    position = 0
+    text = text.rstrip()
+    while position < len(text):
+        match = _TOKEN_RE.match(text, position)
+        if match is None or match.end() == position:
+            raise StrategyError(f"Unexpected input at {position}: {text!r}")
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == "term":
+            value = canonical_term(value)
+        elif kind == "word":
+            value = value.upper()
+        tokens.append((kind, value))
+        position = match.end()
+    return tokens
+
+
+class _Parser:
+    """Recursive-descent parser producing `(node, is_boolean)` pairs.
+
+    Nodes are tuples: `("number", value)`, `("term", term)`,
+    `("neg", node)`, `("arith", op, left, right)`,
+    `("compare", op, left, right)`, `("and"|"or", left, right)` and
+    `("not", node)`.
+    """
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.position = 0
+
+    def peek(self):
+        if self.position < len(self.tokens):
+            return self.tokens[self.position]
+        return (None, None)
+
+    def take(self):
+        token = self.peek()
+        self.position += 1
+        return token
+
+    def expect_boolean(self, parsed, context):
+        node, is_boolean = parsed
+        if not is_boolean:
+            raise StrategyError(f"{context} needs a condition")
+        return node
+
+    def expect_number(self, parsed, context):
+        node, is_boolean = parsed
+        if is_boolean:
+            raise StrategyError(f"{context} needs a numeric expression")
+        return node
+
+    def parse(self):
+        node = self.expect_boolean(self.parse_or(), "A strategy")
+        if self.peek() != (None, None):
+            raise StrategyError(f"Unexpected token {self.peek()[1]!r}")
+        return node
+
+    def parse_or(self):
+        parsed = self.parse_and()
+        while self.peek() == ("word", "OR"):
+            self.take()
+            left = self.expect_boolean(parsed, "OR")
+            right = self.expect_boolean(self.parse_and(), "OR")
+            parsed = (("or", left, right), True)
+        return parsed
+
+    def parse_and(self):
+        parsed = self.parse_not()
+        while self.peek() == ("word", "AND"):
+            self.take()
+            left = self.expect_boolean(parsed, "AND")
+            right = self.expect_boolean(self.parse_not(), "AND")
+            parsed = (("and", left, right), True)
+        return parsed
+
+    def parse_not(self):
+        if self.peek() == ("word", "NOT"):
+            self.take()
+            operand = self.expect_boolean(self.parse_not(), "NOT")
+            return ("not", operand), True
+        return self.parse_comparison()
+
+    def parse_comparison(self):
+        parsed = self.parse_sum()
+        kind, value = self.peek()
+        if kind == "op" and value in COMPARISONS:
+            self.take()
+            left = self.expect_number(parsed, value)
+            right = self.expect_number(self.parse_sum(), value)
+            parsed = (("compare", value, left, right), True)
+        return parsed
+
+    def parse_sum(self):
+        parsed = self.parse_product()
+        while self.peek() in (("op", "+"), ("op", "-")):
+            op = self.take()[1]
+            left = self.expect_number(parsed, op)
+            right = self.expect_number(self.parse_product(), op)
+            parsed = (("arith", op, left, right), False)
+        return parsed
+
+    def parse_product(self):
+        parsed = self.parse_unary()
+        while self.peek() in (("op", "*"), ("op", "/")):
+            op = self.take()[1]
+            left = self.expect_number(parsed, op)
+            right = self.expect_number(self.parse_unary(), op)
+            parsed = (("arith", op, left, right), False)
+        return parsed
+
+    def parse_unary(self):
+        if self.peek() == ("op", "-"):
+            self.take()
+            return ("neg", self.expect_number(self.parse_unary(), "-")), False
+        return self.parse_atom()
+
+    def parse_atom(self):
+        kind, value = self.take()
+        if kind == "number":
+            return ("number", float(value)), False
+        if kind == "term":
+            return ("term", value), False
+        if (kind, value) == ("op", "("):
+            parsed = self.parse_or()
+            if self.take() != ("op", ")"):
+                raise StrategyError("Missing closing parenthesis")
+            return parsed
+        if kind is None:
+            raise StrategyError("Unexpected end of expression")
+        raise StrategyError(f"Unexpected token {value!r}")
+
+
+def render(node):
+    """Render a node as a canonical, fully parenthesized expression."""
+    kind = node[0]
+    if kind == "number":
+        return repr(node[1])
+    if kind == "term":
+        return node[1]
+    if kind == "neg":
+        return f"(-{render(node[1])})"
+    if kind == "not":
+        return f"(NOT {render(node[1])})"
+    if kind in ("and", "or"):
+        return f"({render(node[1])} {kind.upper()} {render(node[2])})"
+    return f"({render(node[2])} {node[1]} {render(node[3])})"
+
+
+def node_terms(node):
+    """Return the price terms a node references, in first-use order."""
+    if node[0] == "term":
+        return (node[1],)
+    if node[0] == "number":
+        return ()
+    children = [child for child in node[1:] if isinstance(child, tuple)]
+    terms = {}
+    for child in children:
+        terms.update(dict.fromkeys(node_terms(child)))
+    return tuple(terms)
+
+
+def compile_node(node):
+    """Compile a node to a function of the term-values lookup."""
+    kind = node[0]
+    if kind == "number":
+        value = node[1]
+        return lambda values: value
+    if kind == "term":
+        term = node[1]
+        return lambda values: values(term)
+    if kind in ("neg", "not"):
+        operand = compile_node(node[1])
+        function = np.negative if kind == "neg" else np.logical_not
+        return lambda values: function(operand(values))
+    if kind in ("and", "or"):
+        function = np.logical_and if kind == "and" else np.logical_or
+        left, right = compile_node(node[1]), compile_node(node[2])
+    else:
+        function = {**COMPARISONS, **ARITHMETIC}[node[1]]
+        left, right = compile_node(node[2]), compile_node(node[3])
+    return lambda values: function(left(values), right(values))
+
+
+def _build(node):
+    """Wrap a parsed boolean node into a `Strategy`."""
+    terms = node_terms(node)
+    condition = compile_node(node)
+
+    def evaluate(values):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            matches = condition(values)
+        for term in terms:
+            # Days missing any referenced price never match
+            matches = matches & ~np.isnan(values(term))
+        return np.asarray(matches, dtype=bool)
+
+    return Strategy(render(node), terms, evaluate)
+
+
+@lru_cache(maxsize=256)
+def compile_strategy(text):
+    """Parse and compile a strategy expression.
+
+    Args:
+        text (str): Strategy expression.
+
+    Returns:
+        Strategy: Compiled strategy.
+
+    Raises:
+        StrategyError: If the expression is invalid.
+    """
+    if len(text) > MAX_STRATEGY_LENGTH:
+        raise StrategyError("Strategy expression is too long")
+    try:
+        return _build(_Parser(tokenize(text)).parse())
+    except RecursionError:
+        raise StrategyError(
+            "Strategy expression is too deeply nested"
+        ) from None
+
+
+@lru_cache(maxsize=256)
+def compile_comparison(term_1, operator, term_2):
+    """Compile a legacy `value_1 operator value_2` comparison.
+
+    Args:
+        term_1 (str): Canonical price term.
+        operator (str): Key of `LEGACY_OPERATORS`.
+        term_2 (str): Canonical price term.
+
+    Returns:
+        Strategy: Compiled strategy.
+    """
+    node = (
+        "compare",
+        LEGACY_OPERATORS[operator],
+        ("term", term_1),
+        ("term", term_2),
+    )
+    return _build(node)
+
+
+def strategy_for(params):
+    """Compile the strategy of a backtest request.
+
+    Requests give either a `strategy` expression or the legacy
+    `value_1`, `operator` and `value_2` fields.
+
+    Args:
+        params (dict): Backtest request fields.
+
+    Returns:
+        Strategy or None: Compiled strategy, or None if it matches no
+            days.
+
+    Raises:
+        StrategyError: If the strategy is invalid.
+    """
+    text = params.get("strategy")
+    if text is not None:
+        if not isinstance(text, str):
+            raise StrategyError("Strategy must be a string")
+        return compile_strategy(text)
+    term_1 = canonical_term(params.get("value_1"))
+    term_2 = canonical_term(params.get("value_2"))
+    operator = params.get("operator")
+    if not isinstance(operator, str) or operator not in LEGACY_OPERATORS:
+        return None
+    return compile_comparison(term_1, operator, term_2)
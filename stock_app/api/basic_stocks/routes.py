@@ -20,7 +20,7 @@ def get_market_counts():
     Returns:
         dict: { 'nyse': <count>, 'nasdaq': <count> }
     """
-    query = "SELECT market, COUNT(*) FROM stocks GROUP BY market"
+    query = "SELECT key, value FROM stock_stats WHERE kind = 'market'"
     try:
         counts = execute_stock_q(query)
         market_counts = {market.lower(): count for market, count in counts}
@@ -39,9 +39,13 @@ def get_unique_stock_count():
     Returns:
         int: Number of unique stocks in the data.
     """
-    query = "SELECT COUNT(DISTINCT Symbol) FROM stocks"
+    query = """
+        SELECT value FROM stock_stats
+        WHERE kind = 'summary' AND key = 'unique_symbols'
+    """
     try:
-        uniq = execute_stock_q(query, fetch_all=False)[0]
+        result = execute_stock_q(query, fetch_all=False)
+        uniq = result[0] if result else 0
         return uniq
     except Exception as e:
         logging.error(f"Database query failed: {e}")
@@ -54,9 +58,13 @@ def get_row_count():
     Returns:
         int: Total number of rows in the data.
     """
-    query = "SELECT COUNT(*) FROM stocks"
+    query = """
+        SELECT value FROM stock_stats
+        WHERE kind = 'summary' AND key = 'rows'
+    """
     try:
-        row_count = execute_stock_q(query, fetch_all=False)[0]
+        result = execute_stock_q(query, fetch_all=False)
+        row_count = result[0] if result else 0
         return row_count
     except Exception as e:
         logging.error(f"Database query failed: {e}")
@@ -2,8 +2,10 @@
 
 import argparse
 import time
+from functools import partial
 
 from stock_app.api.data_utils.loading_utils import (
+    LOAD_BATCH_SIZE,
     create_stocks_db,
     db_clean,
     load_all_stock_data,
@@ -13,12 +15,16 @@ from stock_app.api.logger_utils.custom_logger import custom_logger
 
 
 def execute_command(command_name, task):
-    """Logs the start, end, and duration of a manage_db command."""
+    """Logs the start, end, and duration of a manage_db command.
+
+    If the task returns a row count, the throughput is logged as well.
+    """
     custom_logger.info(f"Command '{command_name}' started.")
     start_time = time.time()
+    result = None
 
     try:
-        task()  # Execute the command logic
+        result = task()  # Execute the command logic
     except Exception as e:
         custom_logger.error(f"Command '{command_name}' failed: {e}")
         raise
@@ -27,6 +33,13 @@ def execute_command(command_name, task):
         custom_logger.info(
             f"Command '{command_name}' completed in {duration:.2f} seconds."
         )
+        if isinstance(result, int) and not isinstance(result, bool):
+            rate = result / duration if duration > 0 else 0.0
+            custom_logger.info(
+                f"Command '{command_name}' loaded {result} rows "
+                f"({rate:,.0f} rows/s)."
+            )
+    return result
 
 
 if __name__ == "__main__":
@@ -36,15 +49,40 @@ if __name__ == "__main__":
     parser.add_argument(
         "command", choices=command_list, help="Command to execute"
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of processes parsing CSV files during a load",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=LOAD_BATCH_SIZE,
+        help="Number of rows inserted and committed at a time during a load",
+    )
+    parser.add_argument(
+        "--bulk",
+        action="store_true",
+        help="Load with fast, non-durable SQLite settings in one transaction",
+    )
 
     args = parser.parse_args()
+    load_options = {
+        "workers": args.workers,
+        "batch_size": args.batch_size,
+        "bulk": args.bulk,
+        "run_task": execute_command,
+    }
 
     # Route commands with logging
     if args.command == "db_create":
         execute_command("db_create", create_stocks_db)
     elif args.command == "db_load":
-        execute_command("db_load", load_all_stock_data)
+        execute_command(
+            "db_load", partial(load_all_stock_data, **load_options)
+        )
     elif args.command == "db_rm":
         execute_command("db_rm", rm_db)
     elif args.command == "db_clean":
-        execute_command("db_clean", db_clean)
+        execute_command("db_clean", partial(db_clean, **load_options))
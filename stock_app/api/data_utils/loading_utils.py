@@ -1,17 +1,107 @@
 """Manage database operations: create, remove, load, and fetch data."""
 
-import csv
-import io
+import os
 import sqlite3
+import threading
 import time
 import zipfile
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
-from os import listdir
+from functools import partial
+from itertools import islice, repeat
 from pathlib import Path
 
+import pandas as pd
+
+from stock_app.api.data_utils.query_stats import record_query, timed_fetch
+from stock_app.api.data_utils.write_queue import WriteQueue, file_identity
 from stock_app.api.logger_utils.custom_logger import custom_logger
 
 DB_PATH = "/app/src/data/stocks.db"
+RAW_DATA_PATH = "/app/src/data/raw_data/"
+LOAD_BATCH_SIZE = 50_000
+# A worker returns a member's parsed rows in one piece, so a parallel load
+# holds up to MAX_PENDING_MEMBERS + 1 whole parsed members in memory.
+MAX_PENDING_MEMBERS = 8
+
+# Stock prices are stored dictionary-encoded: markets and symbols as small
+# integer IDs and dates as day numbers (days since 1970-01-01). The stocks
+# view decodes them back into the original market/Symbol/Date columns.
+MARKETS = {"nasdaq": 0, "nyse": 1}
+PRICE_COLUMNS = ["Open", "High", "Low", "Close", "Volume"]
+
+# Secondary indexes on prices, dropped during bulk loads and rebuilt after.
+# Lookups by symbol use the (symbol_id, day) primary key instead.
+STOCKS_INDEXES = {
+    "idx_prices_day": "CREATE INDEX {name} ON prices (day)",
+}
+
+UPSERT_PRICES_SQL = """
+    INSERT INTO prices (
+        symbol_id, day, market_id, Open, High, Low, Close, Volume
+    )
+    VALUES ((SELECT id FROM symbols WHERE Symbol = ?), ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (symbol_id, day) DO UPDATE SET
+        market_id = excluded.market_id,
+        Open = excluded.Open,
+        High = excluded.High,
+        Low = excluded.Low,
+        Close = excluded.Close,
+        Volume = excluded.Volume
+"""
+
+# SQLite settings for bulk loads: no fsync and a 1 GiB page cache. The
+# journal stays in WAL mode, since switching it needs an exclusive lock
+# that any reader connection kept open by the server would block.
+BULK_LOAD_PRAGMAS = {
+    "synchronous": "OFF",
+    "cache_size": -1_048_576,
+}
+# WAL lets readers keep going while the writer commits.
+DURABLE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -2000,
+    "temp_store": "DEFAULT",
+}
+
+# Settings applied once to every pooled connection and the writer.
+POOL_PRAGMAS = {
+    "busy_timeout": 5000,
+    "cache_size": -65_536,
+    "temp_store": "MEMORY",
+}
+# Read-only connections additionally map up to 1 GiB of the database file
+# so hot pages are read straight from the OS page cache.
+READ_POOL_PRAGMAS = {
+    **POOL_PRAGMAS,
+    "mmap_size": 1 << 30,
+    "query_only": "ON",
+}
+WRITER_PRAGMAS = {
+    **POOL_PRAGMAS,
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+}
+POOL_SIZE = 8
+FETCH_BATCH_SIZE = 10_000
+
+
+def day_number_sql(date_expression):
+    """Build the SQL converting a `%Y-%m-%d` date to a stored day number.
+
+    Comparing `prices.day` (or the `day` column of the stocks view) with
+    this expression keeps date lookups on the day index.
+
+    Args:
+        date_expression (str): SQL expression for the date, e.g. `?`.
+
+    Returns:
+        str: SQL expression evaluating to the day number.
+    """
+    return f"CAST(julianday({date_expression}) - 2440587.5 AS INTEGER)"
 
 
 def get_db_connection():
@@ -21,6 +111,163 @@ def get_db_connection():
     return conn
 
 
+class ConnectionPool:
+    """Pool of SQLite connections reused across requests and threads.
+
+    Connections are configured once with the pool's pragmas, checked out
+    for the duration of a `connection()` block and health-checked before
+    being handed out again. A connection whose database file was deleted
+    or replaced since it was opened fails the check. At most `size` idle
+    connections are kept.
+
+    A read-only pool opens the database with a `mode=ro` URI, so its
+    connections can never take a write lock.
+    """
+
+    def __init__(self, db_path, pragmas=None, size=POOL_SIZE, read_only=False):
+        """Create an empty pool; connections are opened on first use.
+
+        Args:
+            db_path (str): Path to the SQLite database.
+            pragmas (dict, optional): Pragmas applied to new connections.
+            size (int): Maximum number of idle connections kept.
+            read_only (bool): Whether to open read-only connections.
+        """
+        self.db_path = db_path
+        self.pragmas = pragmas or {}
+        self.size = size
+        self.read_only = read_only
+        self._idle = []
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._counters = Counter()
+
+    def _connect(self):
+        """Open and configure a new connection.
+
+        Returns:
+            tuple: The connection and the identity of its database file.
+        """
+        # Read the identity first, so a swap while connecting is caught by
+        # the next health check rather than missed
+        identity = file_identity(self.db_path)
+        if self.read_only:
+            conn = sqlite3.connect(
+                f"{Path(self.db_path).absolute().as_uri()}?mode=ro",
+                uri=True,
+                check_same_thread=False,
+            )
+        else:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        self._counters["created"] += 1
+        return conn, identity
+
+    def _is_healthy(self, conn, identity):
+        """Check that an idle connection still answers queries.
+
+        Args:
+            conn (sqlite3.Connection): Idle connection.
+            identity (tuple): Identity of the database file when the
+                connection was opened.
+
+        Returns:
+            bool: False if the query fails or the file was replaced.
+        """
+        try:
+            conn.execute("SELECT 1").fetchone()
+            healthy = identity == file_identity(self.db_path)
+        except sqlite3.Error:
+            healthy = False
+        if not healthy:
+            self._counters["health_check_failures"] += 1
+        return healthy
+
+    def _checkout(self):
+        """Take a healthy idle connection, or open a new one.
+
+        Returns:
+            tuple: The connection and the identity of its database file.
+        """
+        with self._lock:
+            if self._pid != os.getpid():
+                # Connections must not cross a fork; start a fresh pool
+                self._idle = []
+                self._pid = os.getpid()
+            self._counters["checkouts"] += 1
+            while self._idle:
+                conn, identity = self._idle.pop()
+                if self._is_healthy(conn, identity):
+                    self._counters["reused"] += 1
+                    self._counters["in_use"] += 1
+                    return conn, identity
+                conn.close()
+            conn, identity = self._connect()
+            self._counters["in_use"] += 1
+            return conn, identity
+
+    def _checkin(self, conn, identity):
+        """Return a connection to the pool, closing it if the pool is full."""
+        pooled = False
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            with self._lock:
+                if len(self._idle) < self.size:
+                    self._idle.append((conn, identity))
+                    pooled = True
+        finally:
+            with self._lock:
+                self._counters["in_use"] -= 1
+            if not pooled:
+                conn.close()
+
+    @contextmanager
+    def connection(self):
+        """Check out a connection for the duration of a `with` block.
+
+        Yields:
+            sqlite3.Connection: Pooled database connection.
+        """
+        conn, identity = self._checkout()
+        try:
+            yield conn
+        finally:
+            self._checkin(conn, identity)
+
+    def usage(self):
+        """Report pool usage counters.
+
+        Returns:
+            dict: Connections created and reused, checkouts, failed health
+                checks, and connections currently in use or idle.
+        """
+        with self._lock:
+            return {
+                "created": self._counters["created"],
+                "reused": self._counters["reused"],
+                "checkouts": self._counters["checkouts"],
+                "health_check_failures": self._counters[
+                    "health_check_failures"
+                ],
+                "in_use": self._counters["in_use"],
+                "idle": len(self._idle),
+            }
+
+    def close_all(self):
+        """Close every idle connection."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            conn.close()
+
+
+db_writer = WriteQueue(DB_PATH, WRITER_PRAGMAS)
+read_pool = ConnectionPool(DB_PATH, READ_POOL_PRAGMAS, read_only=True)
+
+
 def execute_sql_command(conn, sql_query, variables=None):
     """Execute an SQL command.
 
@@ -37,30 +284,114 @@ def execute_sql_command(conn, sql_query, variables=None):
         cur.execute(sql_query, variables or ())
 
 
-def execute_stock_q(query, parameter=None, fetch_all=True):
-    """Execute stock-related SQL queries.
+@contextmanager
+def read_snapshot():
+    """Check out a read connection holding one consistent snapshot.
+
+    Every read made through the connection inside the `with` block sees
+    the database as of its first read, even while loads commit.
+
+    Yields:
+        sqlite3.Connection: Read-only connection inside a transaction.
+    """
+    with read_pool.connection() as conn:
+        conn.execute("BEGIN")
+        yield conn
+
+
+@contextmanager
+def _read_connection(conn):
+    """Yield `conn`, or a pooled read connection if it is None."""
+    if conn is not None:
+        yield conn
+        return
+    with read_pool.connection() as pooled:
+        yield pooled
+
+
+def execute_stock_q(query, parameter=None, fetch_all=True, conn=None):
+    """Execute stock-related SQL queries on a pooled connection.
+
+    SELECT queries run on the read-only, memory-mapped `read_pool`; all
+    other statements are queued to the single `db_writer` and this call
+    waits until they are committed. Every query is timed and recorded in
+    the query metrics.
 
     Args:
         query (str): SQL query string.
         parameter (tuple, optional): Query parameters.
         fetch_all (bool): Whether to fetch all rows or a single row.
+        conn (sqlite3.Connection, optional): Read connection to use for a
+            SELECT, e.g. from `read_snapshot`.
 
     Returns:
-        list or sqlite3.Row: Query result.
+        list or sqlite3.Row or WriteResult: Query result, or the row count
+            and last row ID of a write.
     """
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute(query, parameter or ())
-        if query.strip().upper().startswith("SELECT"):
-            return cur.fetchall() if fetch_all else cur.fetchone()
-        conn.commit()
-        return cur
+        if not query.strip().upper().startswith("SELECT"):
+            return db_writer.execute(query, parameter or ())
+        with _read_connection(conn) as read_conn:
+            cur = read_conn.cursor()
+            return timed_fetch(cur, query, parameter or (), fetch_all)
+    except sqlite3.Error as e:
+        custom_logger.error(f"Database error: {e}")
+        raise RuntimeError(f"Database error: {e}") from None
+
+
+def iter_stock_q(
+    query,
+    parameter=None,
+    batch_size=FETCH_BATCH_SIZE,
+    row_factory=True,
+    conn=None,
+):
+    """Stream the rows of a read query in `fetchmany` batches.
+
+    A read-only connection is checked out for the lifetime of the
+    generator and returned when it is exhausted, closed or garbage
+    collected, so only one batch of rows is held in memory at a time.
+
+    Args:
+        query (str): SELECT query string.
+        parameter (tuple, optional): Query parameters.
+        batch_size (int): Number of rows fetched per batch.
+        row_factory (bool): Whether to return `sqlite3.Row` objects
+            rather than plain tuples.
+        conn (sqlite3.Connection, optional): Read connection to use
+            instead of a pooled one, e.g. from `read_snapshot`.
+
+    Yields:
+        list: The next batch of at most `batch_size` rows.
+
+    Raises:
+        RuntimeError: If the query fails.
+    """
+    parameter = parameter or ()
+    try:
+        with _read_connection(conn) as read_conn:
+            cur = read_conn.cursor()
+            if not row_factory:
+                cur.row_factory = None
+            start = time.perf_counter()
+            rows = 0
+            try:
+                cur.execute(query, parameter)
+                while batch := cur.fetchmany(batch_size):
+                    rows += len(batch)
+                    yield batch
+            finally:
+                cur.close()
+                record_query(
+                    read_conn,
+                    query,
+                    parameter,
+                    time.perf_counter() - start,
+                    rows,
+                )
     except sqlite3.Error as e:
         custom_logger.error(f"Database error: {e}")
         raise RuntimeError(f"Database error: {e}") from None
-    finally:
-        conn.close()
 
 
 def create_table(conn, create_statement):
@@ -77,6 +408,298 @@ def create_table(conn, create_statement):
     custom_logger.debug("Table created successfully.")
 
 
+def set_pragmas(conn, pragmas):
+    """Apply SQLite pragmas to a connection and log the resulting values.
+
+    Args:
+        conn (sqlite3.Connection): Database connection.
+        pragmas (dict): Pragma names mapped to the values to set.
+
+    Returns:
+        None
+    """
+    for name, value in pragmas.items():
+        conn.execute(f"PRAGMA {name} = {value}")
+    settings = ", ".join(
+        f"{name}={conn.execute(f'PRAGMA {name}').fetchone()[0]}"
+        for name in pragmas
+    )
+    custom_logger.info(f"SQLite settings: {settings}")
+
+
+def create_stocks_indexes(conn):
+    """Create the secondary indexes on the stocks table.
+
+    Args:
+        conn (sqlite3.Connection): Database connection.
+
+    Returns:
+        None
+    """
+    for name, create_statement in STOCKS_INDEXES.items():
+        execute_sql_command(
+            conn,
+            create_statement.format(name=f"IF NOT EXISTS {name}"),
+        )
+    custom_logger.debug("Stock indexes created successfully.")
+
+
+def drop_stocks_indexes(conn):
+    """Drop the secondary indexes on the stocks table.
+
+    Args:
+        conn (sqlite3.Connection): Database connection.
+
+    Returns:
+        None
+    """
+    for name in STOCKS_INDEXES:
+        execute_sql_command(conn, f"DROP INDEX IF EXISTS {name}")
+
+
+def create_load_manifest(conn):
+    """Create the table recording which ZIP members have been loaded.
+
+    Args:
+        conn (sqlite3.Connection): Database connection.
+
+    Returns:
+        None
+    """
+    create_table(
+        conn,
+        """
+        CREATE TABLE IF NOT EXISTS load_manifest (
+            archive TEXT NOT NULL,
+            member TEXT NOT NULL,
+            file_size INTEGER NOT NULL,
+            crc INTEGER NOT NULL,
+            row_count INTEGER NOT NULL,
+            loaded_at TEXT NOT NULL,
+            PRIMARY KEY (archive, member)
+        )
+        """,
+    )
+
+
+def read_load_manifest(conn, archive):
+    """Fetch the loaded members of an archive.
+
+    Args:
+        conn (sqlite3.Connection): Database connection.
+        archive (str): File name of the ZIP archive.
+
+    Returns:
+        dict: Member name mapped to its loaded (file_size, crc).
+    """
+    cur = conn.execute(
+        "SELECT member, file_size, crc FROM load_manifest WHERE archive = ?",
+        (archive,),
+    )
+    return {member: (file_size, crc) for member, file_size, crc in cur}
+
+
+@contextmanager
+def savepoint(conn, name):
+    """Run a block under a savepoint, rolling it back if the block fails.
+
+    Releasing the outermost savepoint commits, so outside a transaction
+    the block is committed on its own.
+
+    Args:
+        conn (sqlite3.Connection): Database connection.
+        name (str): Savepoint name.
+    """
+    conn.execute(f"SAVEPOINT {name}")
+    try:
+        yield
+    except Exception:
+        conn.execute(f"ROLLBACK TO {name}")
+        conn.execute(f"RELEASE {name}")
+        raise
+    conn.execute(f"RELEASE {name}")
+
+
+def record_loaded_member(conn, archive, info, row_count):
+    """Record a fully loaded ZIP member in the load manifest.
+
+    Args:
+        conn (sqlite3.Connection): Database connection.
+        archive (str): File name of the ZIP archive.
+        info (zipfile.ZipInfo): The loaded member.
+        row_count (int): Number of rows loaded from the member.
+
+    Returns:
+        None
+    """
+    with savepoint(conn, "load_manifest"):
+        conn.execute(
+            """
+            INSERT OR REPLACE INTO load_manifest
+                (archive, member, file_size, crc, row_count, loaded_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            (
+                archive,
+                info.filename,
+                info.file_size,
+                info.CRC,
+                row_count,
+                datetime.now().isoformat(timespec="seconds"),
+            ),
+        )
+
+
+def create_stock_stats(conn):
+    """Create the table of precomputed statistics about the price data.
+
+    Rows are keyed by (kind, key): `market`, `year` and `symbol` kinds hold
+    row counts per market name, year and symbol, and the `summary` kind
+    holds the total row count (`rows`), distinct symbols
+    (`unique_symbols`) and a `data_version` that every refresh raises,
+    which in-memory caches of the price data compare against.
+
+    Args:
+        conn (sqlite3.Connection): Database connection.
+
+    Returns:
+        None
+    """
+    create_table(
+        conn,
+        """
+        CREATE TABLE IF NOT EXISTS stock_stats (
+            kind TEXT NOT NULL,
+            key TEXT NOT NULL,
+            value INTEGER NOT NULL,
+            PRIMARY KEY (kind, key)
+        ) WITHOUT ROWID
+        """,
+    )
+
+
+def refresh_stock_stats(conn):
+    """Recompute the stock_stats table from the prices table.
+
+    Called by the loader after every load that changed prices, so the
+    statistics routes never aggregate the prices table themselves.
+
+    Args:
+        conn (sqlite3.Connection): Database connection.
+
+    Returns:
+        None
+    """
+    with savepoint(conn, "stock_stats"):
+        conn.execute(
+            """
+            DELETE FROM stock_stats
+            WHERE NOT (kind = 'summary' AND key = 'data_version')
+            """
+        )
+        conn.execute(
+            """
+            INSERT INTO stock_stats (kind, key, value)
+            SELECT 'market', markets.name, COUNT(*)
+            FROM prices
+            JOIN markets ON markets.id = prices.market_id
+            GROUP BY prices.market_id
+            """
+        )
+        conn.execute(
+            """
+            INSERT INTO stock_stats (kind, key, value)
+            SELECT 'year', strftime('%Y', day * 86400, 'unixepoch'), COUNT(*)
+            FROM prices
+            GROUP BY 2
+            """
+        )
+        conn.execute(
+            """
+            INSERT INTO stock_stats (kind, key, value)
+            SELECT 'symbol', symbols.Symbol, COUNT(*)
+            FROM prices
+            JOIN symbols ON symbols.id = prices.symbol_id
+            GROUP BY prices.symbol_id
+            """
+        )
+        conn.execute(
+            """
+            INSERT INTO stock_stats (kind, key, value)
+            SELECT 'summary', 'rows', COUNT(*) FROM prices
+            UNION ALL
+            SELECT 'summary', 'unique_symbols', COUNT(DISTINCT symbol_id)
+            FROM prices
+            """
+        )
+        # A nanosecond timestamp, so a recreated database never repeats a
+        # version a running server has cached; still strictly increasing
+        # within one database if the clock steps back
+        conn.execute(
+            """
+            INSERT INTO stock_stats (kind, key, value)
+            VALUES ('summary', 'data_version', ?)
+            ON CONFLICT (kind, key)
+            DO UPDATE SET value = MAX(value + 1, excluded.value)
+            """,
+            (time.time_ns(),),
+        )
+
+
+def get_data_version(conn=None):
+    """Return the version of the loaded price data.
+
+    Args:
+        conn (sqlite3.Connection, optional): Read connection to use.
+
+    Returns:
+        int: The `data_version` statistic, 0 before the first load.
+    """
+    result = execute_stock_q(
+        """
+        SELECT value FROM stock_stats
+        WHERE kind = 'summary' AND key = 'data_version'
+        """,
+        fetch_all=False,
+        conn=conn,
+    )
+    return result[0] if result else 0
+
+
+def create_trading_days(conn):
+    """Create the trading calendar table: one row per day with prices.
+
+    Args:
+        conn (sqlite3.Connection): Database connection.
+
+    Returns:
+        None
+    """
+    create_table(
+        conn,
+        "CREATE TABLE IF NOT EXISTS trading_days (day INTEGER PRIMARY KEY)",
+    )
+
+
+def refresh_trading_days(conn):
+    """Rebuild the trading calendar from the prices table.
+
+    Args:
+        conn (sqlite3.Connection): Database connection.
+
+    Returns:
+        None
+    """
+    with savepoint(conn, "trading_days"):
+        conn.execute("DELETE FROM trading_days")
+        conn.execute(
+            """
+            INSERT INTO trading_days (day)
+            SELECT DISTINCT day FROM prices ORDER BY day
+            """
+        )
+
+
 def create_stocks_db():
     """Create a SQLite database with required tables."""
     if Path(DB_PATH).exists():
@@ -84,20 +707,66 @@ def create_stocks_db():
 
     conn = sqlite3.connect(DB_PATH)
     custom_logger.info("Connected to database.")
+    set_pragmas(conn, {"journal_mode": DURABLE_PRAGMAS["journal_mode"]})
 
     create_table(
         conn,
         """
-        CREATE TABLE stocks (
-            market TEXT,
-            Symbol TEXT,
-            Date DATE,
+        CREATE TABLE markets (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE
+        )
+        """,
+    )
+    with conn:
+        conn.executemany(
+            "INSERT INTO markets (name, id) VALUES (?, ?)", MARKETS.items()
+        )
+
+    create_table(
+        conn,
+        """
+        CREATE TABLE symbols (
+            id INTEGER PRIMARY KEY,
+            Symbol TEXT NOT NULL UNIQUE
+        )
+        """,
+    )
+
+    create_table(
+        conn,
+        """
+        CREATE TABLE prices (
+            symbol_id INTEGER NOT NULL,
+            day INTEGER NOT NULL,
+            market_id INTEGER NOT NULL,
             Open REAL,
             High REAL,
             Low REAL,
             Close REAL,
-            Volume INTEGER
-        )
+            Volume INTEGER,
+            PRIMARY KEY (symbol_id, day)
+        ) WITHOUT ROWID
+        """,
+    )
+
+    create_table(
+        conn,
+        """
+        CREATE VIEW stocks AS
+        SELECT
+            markets.name AS market,
+            symbols.Symbol AS Symbol,
+            date(prices.day * 86400, 'unixepoch') AS Date,
+            prices.Open AS Open,
+            prices.High AS High,
+            prices.Low AS Low,
+            prices.Close AS Close,
+            prices.Volume AS Volume,
+            prices.day AS day
+        FROM prices
+        JOIN symbols ON symbols.id = prices.symbol_id
+        JOIN markets ON markets.id = prices.market_id
         """,
     )
 
@@ -124,111 +793,412 @@ def create_stocks_db():
         """,
     )
 
+    create_load_manifest(conn)
+    create_stock_stats(conn)
+    create_trading_days(conn)
+    create_stocks_indexes(conn)
+
     conn.close()
     return True
 
 
-def load_csv_to_db(conn, zip_path, table_name):
-    """Load CSV data from a ZIP file into a SQLite table.
+def iter_csv_batches(f, csv_file, batch_size=LOAD_BATCH_SIZE):
+    """Parse an open CSV member into batches of insertable rows.
+
+    The member is streamed in chunks of `batch_size` rows and its
+    `%d-%b-%Y` date column is converted to day numbers one chunk at a
+    time, so memory is bounded by the batch size rather than the file
+    size. Rows with invalid dates are dropped and reported in a single
+    warning.
+
+    Args:
+        f (file): Binary file object for the CSV member.
+        csv_file (str): Name of the CSV member, used to infer the market.
+        batch_size (int): Number of rows per batch.
+
+    Yields:
+        list: Row tuples matching the parameters of `UPSERT_PRICES_SQL`.
+    """
+    market_id = MARKETS["nasdaq" if "NASDAQ" in csv_file else "nyse"]
+    invalid_dates = 0
+
+    chunks = pd.read_csv(
+        f,
+        dtype=str,
+        keep_default_na=False,
+        chunksize=batch_size,
+        encoding="utf-8",
+    )
+    for chunk in chunks:
+        date_column = next(
+            (column for column in chunk.columns if "date" in column.lower()),
+            None,
+        )
+        if date_column is None:
+            raise ValueError(f"No date column in {csv_file}")
+
+        dates = pd.to_datetime(
+            chunk[date_column], format="%d-%b-%Y", errors="coerce"
+        )
+        valid = dates.notna()
+        invalid_dates += int((~valid).sum())
+        chunk = chunk[valid]
+        days = dates[valid].to_numpy().astype("datetime64[D]").astype(int)
+
+        columns = [chunk[column].tolist() for column in PRICE_COLUMNS]
+        yield list(
+            zip(
+                chunk["Symbol"].tolist(),
+                days.tolist(),
+                repeat(market_id),
+                *columns,
+            )
+        )
+
+    if invalid_dates:
+        custom_logger.warning(
+            f"Skipping {invalid_dates} rows with invalid dates in {csv_file}"
+        )
+
+
+def parse_csv_member(zip_path, csv_file, batch_size=LOAD_BATCH_SIZE):
+    """Parse a single CSV member of a ZIP file.
+
+    Runs in loader worker processes, so it only takes picklable arguments.
+    The whole member is parsed before it is returned, so its rows are held
+    in memory at once. A chunk that fails to parse ends the member; the
+    batches parsed before it are returned with the error.
 
     Args:
-        conn (sqlite3.Connection): Database connection.
         zip_path (str): Path to the ZIP file.
-        table_name (str): Name of the table to load data into.
+        csv_file (str): Name of the CSV member inside the ZIP file.
+        batch_size (int): Number of rows per batch.
 
     Returns:
-        bool: True if successful.
+        tuple: (batches, error) where `batches` lists the row batches as
+            yielded by `iter_csv_batches` and `error` is the exception
+            that stopped parsing, or None.
     """
-    with zipfile.ZipFile(zip_path, "r") as zf:
-        file_list = zf.namelist()
-        for csv_file in file_list:
-            with zf.open(csv_file) as f:
-                text_file = io.TextIOWrapper(f, encoding="utf-8")
-                reader = csv.reader(text_file)
-                headers = next(reader)
-
-                date_index = next(
-                    (
-                        i
-                        for i, header in enumerate(headers)
-                        if "date" in header.lower()
+    batches = []
+    try:
+        with zipfile.ZipFile(zip_path, "r") as zf, zf.open(csv_file) as f:
+            # extend keeps the batches appended before an error
+            batches.extend(iter_csv_batches(f, csv_file, batch_size))
+    except (ValueError, KeyError, zipfile.BadZipFile) as e:
+        return batches, e
+    return batches, None
+
+
+def insert_rows(conn, rows):
+    """Upsert parsed rows into the prices table.
+
+    New symbols are added to the symbols table first. A row whose
+    (symbol, day) already exists updates the stored row. The rows are not
+    committed; see `insert_batches`.
+
+    Args:
+        conn (sqlite3.Connection): Database connection.
+        rows (list): Row tuples as yielded by `iter_csv_batches`.
+
+    Returns:
+        int: Number of rows inserted or updated.
+    """
+    cur = conn.cursor()
+    cur.executemany(
+        "INSERT OR IGNORE INTO symbols (Symbol) VALUES (?)",
+        {(row[0],) for row in rows},
+    )
+    cur.executemany(UPSERT_PRICES_SQL, rows)
+    return len(rows)
+
+
+def insert_batches(conn, batches, csv_file):
+    """Insert row batches, each under its own savepoint.
+
+    A batch that fails to insert is rolled back and logged; the batches
+    before and after it are kept. Outside a transaction each batch is
+    committed on its own; inside one (bulk loads) the batches are
+    committed together with the transaction.
+
+    Args:
+        conn (sqlite3.Connection): Database connection.
+        batches (iterable): Row batches.
+        csv_file (str): Name of the CSV member, used in log output.
+
+    Returns:
+        tuple: (rows inserted, number of failed batches).
+    """
+    total_rows = 0
+    failed_batches = 0
+    for rows in batches:
+        try:
+            with savepoint(conn, "load_batch"):
+                total_rows += insert_rows(conn, rows)
+        except sqlite3.Error as e:
+            failed_batches += 1
+            custom_logger.error(
+                f"Error inserting {len(rows)} rows from {csv_file}: {e}"
+            )
+    return total_rows, failed_batches
+
+
+def _member_batches(zf, csv_file, batch_size):
+    """Stream the batches of a CSV member parsed in this process."""
+    with zf.open(csv_file) as f:
+        yield from iter_csv_batches(f, csv_file, batch_size)
+
+
+def _future_batches(future):
+    """Stream the batches of a CSV member parsed by a worker process.
+
+    A parse error is raised after the batches parsed before it.
+    """
+    batches, error = future.result()
+    yield from batches
+    if error is not None:
+        raise error
+
+
+def iter_archive_members(
+    zf, zip_path, file_list, pool=None, batch_size=LOAD_BATCH_SIZE
+):
+    """Iterate over CSV members of an open ZIP file.
+
+    With a pool, at most `MAX_PENDING_MEMBERS` members are parsed ahead of
+    the writer. Workers return whole members, so memory is bounded by
+    `MAX_PENDING_MEMBERS + 1` parsed members rather than by the batch size.
+    Either way, a member's batches are yielded up to the first chunk that
+    fails to parse, and the parse error is then raised.
+
+    Args:
+        zf (zipfile.ZipFile): Open ZIP file.
+        zip_path (str): Path to the ZIP file, passed to worker processes.
+        file_list (list): Names of the members to iterate over.
+        pool (concurrent.futures.Executor, optional): Parser worker pool.
+        batch_size (int): Number of rows per batch.
+
+    Yields:
+        tuple: (csv_file, batches) where `batches` lazily yields the
+            member's row batches.
+    """
+    members = iter(file_list)
+    if pool is None:
+        for csv_file in members:
+            yield csv_file, _member_batches(zf, csv_file, batch_size)
+        return
+
+    pending = deque(
+        (
+            csv_file,
+            pool.submit(parse_csv_member, zip_path, csv_file, batch_size),
+        )
+        for csv_file in islice(members, MAX_PENDING_MEMBERS)
+    )
+    while pending:
+        csv_file, future = pending.popleft()
+        next_file = next(members, None)
+        if next_file is not None:
+            pending.append(
+                (
+                    next_file,
+                    pool.submit(
+                        parse_csv_member, zip_path, next_file, batch_size
                     ),
-                    None,
                 )
+            )
+        yield csv_file, _future_batches(future)
 
-                headers = ["market"] + headers
-                placeholders = ",".join("?" for _ in headers)
-                market = "nasdaq" if "NASDAQ" in csv_file else "nyse"
-                insert_sql = (
-                    f"INSERT INTO {table_name} ({','.join(headers)}) "
-                    f"VALUES ({placeholders})"
+
+def load_csv_to_db(conn, zip_path, pool=None, batch_size=LOAD_BATCH_SIZE):
+    """Load CSV data from a ZIP file into the prices table.
+
+    Rows are upserted in batches of `batch_size`. Members whose size and
+    CRC match the load manifest are skipped, and each member is recorded
+    in the manifest once all of its batches are in. A member that fails
+    to parse part-way keeps the batches before the error but is not
+    recorded, so the next load parses it again.
+
+    Args:
+        conn (sqlite3.Connection): Database connection.
+        zip_path (str): Path to the ZIP file.
+        pool (concurrent.futures.Executor, optional): Worker pool used to
+            parse CSV members in parallel. Parsed rows are always written
+            by the calling process.
+        batch_size (int): Number of rows per insert.
+
+    Returns:
+        int: Number of rows inserted.
+    """
+    archive = Path(zip_path).name
+    loaded = read_load_manifest(conn, archive)
+    total_rows = 0
+    with zipfile.ZipFile(zip_path, "r") as zf:
+        changed = {
+            info.filename: info
+            for info in zf.infolist()
+            if loaded.get(info.filename) != (info.file_size, info.CRC)
+        }
+        skipped = len(zf.infolist()) - len(changed)
+        if skipped:
+            custom_logger.info(
+                f"Skipping {skipped} unchanged members of {archive}."
+            )
+
+        for csv_file, batches in iter_archive_members(
+            zf, zip_path, list(changed), pool, batch_size
+        ):
+            try:
+                row_count, failed_batches = insert_batches(
+                    conn, batches, csv_file
                 )
+                total_rows += row_count
+                if not failed_batches:
+                    record_loaded_member(
+                        conn, archive, changed[csv_file], row_count
+                    )
+            except Exception as e:
+                custom_logger.error(f"Error loading {csv_file}: {e}")
+                continue
+    return total_rows
 
-                rows_to_insert = []
-                for row in reader:
-                    if date_index is not None:
-                        try:
-                            original_date = row[date_index]
-                            row[date_index] = datetime.strptime(
-                                original_date, "%d-%b-%Y"
-                            ).strftime("%Y-%m-%d")
-                        except ValueError:
-                            custom_logger.warning(
-                                f"Skipping invalid date: {original_date}"
-                            )
-                            continue
-
-                    rows_to_insert.append((market, *row))
-
-                cur = conn.cursor()
-                try:
-                    cur.executemany(insert_sql, rows_to_insert)
-                    conn.commit()
-                except Exception as e:
-                    custom_logger.error(f"Error inserting rows: {e}")
-                    continue
-    return True
 
+def list_stock_archives(data_path=RAW_DATA_PATH):
+    """List the stock data archives to load.
+
+    Args:
+        data_path (str): Directory holding the NASDAQ/NYSE ZIP files.
 
-def load_all_stock_data():
+    Returns:
+        list: Sorted paths of the archives.
+    """
+    return sorted(str(p) for p in Path(data_path).iterdir() if p.is_file())
+
+
+def run_timed_task(task_name, task):
+    """Run a loader task and log its duration.
+
+    Args:
+        task_name (str): Name used in the log output.
+        task (callable): Task to run.
+
+    Returns:
+        The task's return value.
+    """
+    custom_logger.info(f"Running {task_name}...")
+    start_time = time.time()
+    result = task()
+    duration = time.time() - start_time
+    custom_logger.info(f"Finished {task_name} in {duration:.2f} seconds.")
+    return result
+
+
+def load_all_stock_data(
+    workers=1, batch_size=LOAD_BATCH_SIZE, bulk=False, run_task=run_timed_task
+):
     """Load all stock data from ZIP files into the database.
 
+    CSV members are parsed by a pool of `workers` processes while this
+    process stays the single writer to SQLite.
+
+    Members already recorded in the load manifest with the same size and
+    CRC are skipped, so repeated loads only pick up new or changed data.
+
+    In bulk mode the load runs with `BULK_LOAD_PRAGMAS` in a single
+    transaction, the stocks indexes are dropped first and rebuilt once the
+    data is in, and the `DURABLE_PRAGMAS` values of the bulk settings are
+    restored at the end.
+
+    Args:
+        workers (int): Number of parser processes. 1 parses in-process.
+        batch_size (int): Number of rows per insert and commit.
+        bulk (bool): Whether to use the bulk-load fast path.
+        run_task (callable): Called as `run_task(name, task)` for each
+            archive and load phase, e.g. `db_manage.execute_command` to log
+            timings and throughput.
+
     Returns:
         None
     """
-    data_path = "/app/src/data/raw_data/"
-    table_name = "stocks"
     conn = get_db_connection()
-    all_files = [
-        f"{data_path}/{f}"
-        for f in listdir(data_path)
-        if Path(f"{data_path}/{f}").is_file()
-    ]
-
-    for zip_path in all_files:
-        try:
-            custom_logger.info(f"Loading data from {Path(zip_path).name}...")
-            start_time = time.time()
-            load_csv_to_db(conn, zip_path, table_name)
-            duration = time.time() - start_time
-            custom_logger.info(f"Loaded data in {duration:.2f} seconds.")
-        except Exception as e:
-            custom_logger.error(f"Error processing {Path(zip_path).name}: {e}")
+    if not conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'prices'"
+    ).fetchone():
+        conn.close()
+        raise RuntimeError(
+            "Database predates the compact prices layout; run db_clean."
+        )
+    pool = None
+    total_rows = 0
+    try:
+        pool = (
+            ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+        )
+        create_load_manifest(conn)
+        create_stock_stats(conn)
+        create_trading_days(conn)
+        if bulk:
+            set_pragmas(conn, BULK_LOAD_PRAGMAS)
+            drop_stocks_indexes(conn)
+            conn.execute("BEGIN")
 
-    conn.close()
+        for zip_path in list_stock_archives():
+            try:
+                total_rows += run_task(
+                    Path(zip_path).name,
+                    partial(
+                        load_csv_to_db,
+                        conn,
+                        zip_path,
+                        pool,
+                        batch_size,
+                    ),
+                )
+            except Exception as e:
+                custom_logger.error(
+                    f"Error processing {Path(zip_path).name}: {e}"
+                )
+        if bulk:
+            run_task("commit", conn.commit)
+            run_task("index build", partial(create_stocks_indexes, conn))
+        if total_rows:
+            run_task("trading calendar", partial(refresh_trading_days, conn))
+            run_task("statistics", partial(refresh_stock_stats, conn))
+            run_task("analyze", partial(execute_sql_command, conn, "ANALYZE"))
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        if bulk:
+            conn.commit()
+            set_pragmas(
+                conn,
+                {name: DURABLE_PRAGMAS[name] for name in BULK_LOAD_PRAGMAS},
+            )
+        conn.close()
 
 
 def rm_db():
-    """Delete database files."""
+    """Delete database files, with their WAL and shared-memory files."""
     for db_file in ["stocks.db", "accounts.db", "stocks_owned.db"]:
-        db_path = Path(f"/app/src/data/{db_file}")
-        if db_path.exists():
-            db_path.unlink()
-            custom_logger.info(f"Deleted {db_file}")
+        for suffix in ["", "-wal", "-shm"]:
+            db_path = Path(f"/app/src/data/{db_file}{suffix}")
+            if db_path.exists():
+                db_path.unlink()
+                custom_logger.info(f"Deleted {db_file}{suffix}")
+
 
+def db_clean(
+    workers=1, batch_size=LOAD_BATCH_SIZE, bulk=False, run_task=run_timed_task
+):
+    """Remove, create, and load the database.
 
-def db_clean():
-    """Remove, create, and load the database."""
+    Args:
+        workers (int): Number of parser processes for the load.
+        batch_size (int): Number of rows per insert and commit.
+        bulk (bool): Whether to use the bulk-load fast path.
+        run_task (callable): Per-archive task runner for the load.
+    """
     rm_db()
     create_stocks_db()
-    load_all_stock_data()
+    load_all_stock_data(
+        workers=workers, batch_size=batch_size, bulk=bulk, run_task=run_task
+    )
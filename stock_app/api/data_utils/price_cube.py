@@ -0,0 +1,310 @@
+"""Hold all prices in memory as dense symbols x trading-days arrays.
+
+The cube is loaded once per process from the prices table, shared
+read-only by every request and reloaded when the data version in
+`stock_stats` changes. Rows follow symbols in sorted order and columns
+follow the trading calendar, so a backtest window is a slice of columns
+and a lag in trading days is a shifted column slice.
+"""
+
+import threading
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from stock_app.api.data_utils.loading_utils import (
+    execute_stock_q,
+    get_data_version,
+    iter_stock_q,
+    read_snapshot,
+)
+from stock_app.api.data_utils.trading_calendar import (
+    TradingCalendar,
+    load_trading_calendar,
+)
+from stock_app.api.logger_utils.custom_logger import custom_logger
+
+CUBE_COLUMNS = ["Open", "High", "Low", "Close"]
+
+
+class PriceCube:
+    """Open, High, Low and Close prices per symbol and trading day."""
+
+    def __init__(self, symbols, calendar, prices, present, markets):
+        """Wrap preloaded arrays; they are made read-only.
+
+        Args:
+            symbols (list[str]): Symbols in row order, sorted.
+            calendar (TradingCalendar): Trading days in column order.
+            prices (dict): `CUBE_COLUMNS` names mapped to float64 arrays of
+                shape (symbols, trading days), NaN where there is no row.
+            present (numpy.ndarray): Boolean array of the same shape, True
+                where the prices table has a row.
+            markets (numpy.ndarray): Market ID of each symbol's rows, -1
+                for symbols without prices.
+        """
+        self.symbols = symbols
+        self.calendar = calendar
+        self.days = np.asarray(calendar.days, dtype=np.int64)
+        self.version = calendar.version
+        self.prices = prices
+        self.present = present
+        self.markets = markets
+        for array in (*prices.values(), present, markets):
+            array.flags.writeable = False
+
+    def partition(self, rows):
+        """Return a cube over a subset of the symbols.
+
+        Args:
+            rows (slice or numpy.ndarray): Symbol rows to keep, in order. A
+                slice shares the arrays; an index array copies them.
+
+        Returns:
+            PriceCube: Cube over the given rows.
+        """
+        if isinstance(rows, slice):
+            symbols = self.symbols[rows]
+        else:
+            symbols = [self.symbols[row] for row in rows]
+        return PriceCube(
+            symbols,
+            self.calendar,
+            {column: array[rows] for column, array in self.prices.items()},
+            self.present[rows],
+            self.markets[rows],
+        )
+
+    def rows_for(self, symbols=None, market_id=None):
+        """Return the rows of the symbols matching a universe filter.
+
+        Args:
+            symbols (Iterable[str], optional): Symbols to keep; unknown
+                symbols are ignored.
+            market_id (int, optional): Market whose symbols to keep.
+
+        Returns:
+            numpy.ndarray: Matching rows in ascending order.
+        """
+        keep = np.ones(len(self.symbols), dtype=bool)
+        if symbols is not None:
+            keep &= np.isin(self.symbols, list(symbols))
+        if market_id is not None:
+            keep &= self.markets == market_id
+        return np.flatnonzero(keep)
+
+    def window(self, start_date, end_date):
+        """Return the column slice between two trading days, inclusive.
+
+        Args:
+            start_date (str): First trading day.
+            end_date (str): Last trading day.
+
+        Returns:
+            slice: Columns of the window; empty if either date is not a
+                trading day.
+        """
+        start = self.calendar.position(start_date)
+        end = self.calendar.position(end_date)
+        if start is None or end is None:
+            return slice(0, 0)
+        return slice(start, end + 1)
+
+    def lagged(self, column, columns, lag_days):
+        """Return prices from `lag_days` calendar days before each column.
+
+        Args:
+            column (str): Price column, one of `CUBE_COLUMNS`.
+            columns (slice): Columns to compute lagged values for.
+            lag_days (int): Calendar days to look back.
+
+        Returns:
+            numpy.ndarray: Array of shape (symbols, window), NaN where the
+                lagged day is not a trading day or has no price.
+        """
+        days = self.days
+        if not len(days):
+            return np.empty((len(self.symbols), 0))
+        lagged_days = days[columns] - lag_days
+        positions = np.searchsorted(days, lagged_days)
+        positions = np.minimum(positions, len(days) - 1)
+        found = days[positions] == lagged_days
+        values = self.prices[column][:, positions]
+        return np.where(found, values, np.nan)
+
+    def shifted(self, column, columns, lag_days):
+        """Return prices from `lag_days` trading days before each column.
+
+        Columns are trading days, so the lag is a shift of the column
+        slice and the result is a view where the window allows.
+
+        Args:
+            column (str): Price column, one of `CUBE_COLUMNS`.
+            columns (slice): Columns to compute lagged values for.
+            lag_days (int): Trading days to look back.
+
+        Returns:
+            numpy.ndarray: Array of shape (symbols, window), NaN where the
+                lagged day is before the first trading day or has no price.
+        """
+        start, stop, _ = columns.indices(len(self.days))
+        if start >= stop:
+            return np.empty((len(self.symbols), 0))
+        values = self.prices[column]
+        if start >= lag_days:
+            return values[:, start - lag_days : stop - lag_days]
+        missing = min(lag_days - start, stop - start)
+        return np.hstack(
+            [
+                np.full((len(self.symbols), missing), np.nan),
+                values[:, : max(stop - lag_days, 0)],
+            ]
+        )
+
+
+class SharedPriceCube:
+    """Copy of a price cube in shared memory, attachable by other processes.
+
+    The creating process owns the memory blocks and must call `close()`
+    once no worker uses them any more.
+    """
+
+    def __init__(self, cube):
+        """Copy the cube's arrays into new shared memory blocks.
+
+        Args:
+            cube (PriceCube): Cube to share.
+        """
+        arrays = {
+            **cube.prices,
+            "present": cube.present,
+            "markets": cube.markets,
+        }
+        self._blocks = []
+        self.spec = {
+            "symbols": cube.symbols,
+            "days": cube.calendar.days,
+            "version": cube.version,
+            "arrays": {},
+        }
+        for name, array in arrays.items():
+            block = shared_memory.SharedMemory(
+                create=True, size=max(array.nbytes, 1)
+            )
+            shared = np.ndarray(array.shape, array.dtype, buffer=block.buf)
+            shared[...] = array
+            self._blocks.append(block)
+            self.spec["arrays"][name] = (
+                block.name,
+                array.shape,
+                array.dtype.str,
+            )
+
+    def close(self):
+        """Release and remove the shared memory blocks."""
+        for block in self._blocks:
+            block.close()
+            block.unlink()
+        self._blocks = []
+
+
+def attach_price_cube(spec):
+    """Build a read-only cube over shared memory created by another process.
+
+    Args:
+        spec (dict): `SharedPriceCube.spec` of the shared cube.
+
+    Returns:
+        tuple: The `PriceCube` and the attached memory blocks, which must
+            stay referenced while the cube is in use.
+    """
+    blocks = []
+    arrays = {}
+    for name, (block_name, shape, dtype) in spec["arrays"].items():
+        block = shared_memory.SharedMemory(name=block_name)
+        blocks.append(block)
+        arrays[name] = np.ndarray(shape, dtype, buffer=block.buf)
+    present = arrays.pop("present")
+    markets = arrays.pop("markets")
+    calendar = TradingCalendar(spec["days"], spec["version"])
+    cube = PriceCube(spec["symbols"], calendar, arrays, present, markets)
+    return cube, blocks
+
+
+def load_price_cube():
+    """Read every price into a new cube.
+
+    The calendar, symbols and prices are read from one snapshot. Rows
+    whose day is not yet in the trading calendar, as while a load is
+    between committing prices and refreshing the calendar, or whose
+    symbol is unknown are left out; the finished load changes the data
+    version, and the cube is reloaded then.
+
+    Returns:
+        PriceCube: Cube matching the current data version.
+    """
+    with read_snapshot() as conn:
+        calendar = load_trading_calendar(conn)
+        symbol_rows = execute_stock_q(
+            "SELECT id, Symbol FROM symbols", conn=conn
+        )
+        symbol_rows = sorted(symbol_rows, key=lambda row: row[1])
+        symbols = [symbol for _, symbol in symbol_rows]
+        days = np.asarray(calendar.days, dtype=np.int64)
+        max_id = max((symbol_id for symbol_id, _ in symbol_rows), default=0)
+        row_of = np.full(max_id + 1, -1, dtype=np.int64)
+        for row, (symbol_id, _) in enumerate(symbol_rows):
+            row_of[symbol_id] = row
+
+        shape = (len(symbols), len(days))
+        prices = {column: np.full(shape, np.nan) for column in CUBE_COLUMNS}
+        present = np.zeros(shape, dtype=bool)
+        markets = np.full(len(symbols), -1, dtype=np.int8)
+        dropped = 0
+        query = f"""
+            SELECT symbol_id, day, market_id, {", ".join(CUBE_COLUMNS)}
+            FROM prices
+        """
+        for batch in iter_stock_q(query, row_factory=False, conn=conn):
+            values = np.array(batch, dtype=float)
+            symbol_ids = values[:, 0].astype(np.int64)
+            row_days = values[:, 1].astype(np.int64)
+            known = (symbol_ids >= 0) & (symbol_ids <= max_id)
+            rows = np.full(len(values), -1, dtype=np.int64)
+            rows[known] = row_of[symbol_ids[known]]
+            cols = np.searchsorted(days, row_days)
+            # Only rows whose day is exactly a calendar day have a column
+            keep = cols < len(days)
+            keep[keep] = days[cols[keep]] == row_days[keep]
+            keep &= rows >= 0
+            dropped += int(len(keep) - keep.sum())
+            rows, cols, values = rows[keep], cols[keep], values[keep]
+            present[rows, cols] = True
+            markets[rows] = values[:, 2]
+            for i, column in enumerate(CUBE_COLUMNS, start=3):
+                prices[column][rows, cols] = values[:, i]
+    if dropped:
+        custom_logger.warning(
+            f"Price cube skipped {dropped} rows missing from the trading "
+            "calendar or symbols"
+        )
+    return PriceCube(symbols, calendar, prices, present, markets)
+
+
+_lock = threading.Lock()
+_cube = None
+
+
+def get_price_cube():
+    """Return the shared price cube, reloading it after a data load.
+
+    Returns:
+        PriceCube: Cube matching the current data version.
+    """
+    global _cube
+    version = get_data_version()
+    if _cube is None or _cube.version != version:
+        with _lock:
+            if _cube is None or _cube.version != version:
+                _cube = load_price_cube()
+    return _cube
@@ -0,0 +1,162 @@
+"""Time SQL queries and keep per-statement metrics.
+
+Every query issued through `timed_fetch` is timed and aggregated under
+its normalized SQL text. Queries slower than `SLOW_QUERY_MS` are logged
+together with their `EXPLAIN QUERY PLAN` output, so full scans show up
+in the application log.
+"""
+
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+
+from stock_app.api.logger_utils.custom_logger import custom_logger
+
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", "100"))
+MAX_SLOW_QUERIES = 100
+
+_LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+_lock = threading.Lock()
+_statements = {}
+_slow_queries = deque(maxlen=MAX_SLOW_QUERIES)
+
+
+def normalize_sql(sql):
+    """Reduce a SQL statement to a key shared by all its executions.
+
+    Whitespace is collapsed and string and numeric literals are replaced
+    by `?`, so queries that only differ in inlined values aggregate
+    together.
+
+    Args:
+        sql (str): SQL statement.
+
+    Returns:
+        str: Normalized SQL text.
+    """
+    sql = _LITERAL_RE.sub("?", sql)
+    return _WHITESPACE_RE.sub(" ", sql).strip()
+
+
+def explain_query_plan(conn, sql, parameters=()):
+    """Return the `EXPLAIN QUERY PLAN` output of a statement.
+
+    Args:
+        conn (sqlite3.Connection): Connection the statement ran on.
+        sql (str): SQL statement.
+        parameters (tuple): Statement parameters.
+
+    Returns:
+        list[str]: One line per plan step, or the error if the plan
+        could not be produced.
+    """
+    try:
+        cur = conn.cursor()
+        cur.row_factory = None
+        rows = cur.execute(f"EXPLAIN QUERY PLAN {sql}", parameters)
+        return [row[-1] for row in rows]
+    except sqlite3.Error as e:
+        return [f"unavailable: {e}"]
+
+
+def record_query(conn, sql, parameters, elapsed, rows):
+    """Add one execution to the statement metrics.
+
+    Args:
+        conn (sqlite3.Connection): Connection the statement ran on, used
+            to explain slow queries.
+        sql (str): SQL statement.
+        parameters (tuple): Statement parameters.
+        elapsed (float): Execution time in seconds.
+        rows (int): Rows returned or affected.
+    """
+    key = normalize_sql(sql)
+    elapsed_ms = elapsed * 1000
+    with _lock:
+        stats = _statements.setdefault(
+            key, {"calls": 0, "total_ms": 0.0, "max_ms": 0.0, "rows": 0}
+        )
+        stats["calls"] += 1
+        stats["total_ms"] += elapsed_ms
+        stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+        stats["rows"] += rows
+
+    if elapsed_ms < SLOW_QUERY_MS:
+        return
+    plan = explain_query_plan(conn, sql, parameters)
+    with _lock:
+        _slow_queries.append(
+            {"sql": key, "ms": elapsed_ms, "rows": rows, "plan": plan}
+        )
+    custom_logger.warning(
+        f"Slow query ({elapsed_ms:.1f} ms, {rows} rows): {key}\n"
+        + "\n".join(f"  {step}" for step in plan)
+    )
+
+
+def timed_fetch(cur, sql, parameters=(), fetch_all=True):
+    """Execute a statement on a cursor, fetch its result and record it.
+
+    Args:
+        cur (sqlite3.Cursor): Cursor to execute on.
+        sql (str): SQL statement.
+        parameters (tuple): Statement parameters.
+        fetch_all (bool): Whether to fetch all rows or a single row.
+
+    Returns:
+        list or sqlite3.Row or None: Fetched rows for queries returning
+        rows, otherwise None.
+    """
+    start = time.perf_counter()
+    cur.execute(sql, parameters)
+    if cur.description is None:
+        result = None
+        rows = max(cur.rowcount, 0)
+    elif fetch_all:
+        result = cur.fetchall()
+        rows = len(result)
+    else:
+        result = cur.fetchone()
+        rows = int(result is not None)
+    record_query(
+        cur.connection, sql, parameters, time.perf_counter() - start, rows
+    )
+    return result
+
+
+def query_stats():
+    """Return the aggregated metrics per normalized statement.
+
+    Returns:
+        dict: Metrics keyed by normalized SQL, with `calls`, `rows`,
+        `total_ms`, `mean_ms` and `max_ms`, slowest total first.
+    """
+    with _lock:
+        snapshot = {key: dict(stats) for key, stats in _statements.items()}
+    for stats in snapshot.values():
+        stats["mean_ms"] = stats["total_ms"] / stats["calls"]
+    return dict(
+        sorted(snapshot.items(), key=lambda item: -item[1]["total_ms"])
+    )
+
+
+def slow_queries():
+    """Return the most recent slow queries with their query plans.
+
+    Returns:
+        list[dict]: Up to `MAX_SLOW_QUERIES` entries, oldest first.
+    """
+    with _lock:
+        return list(_slow_queries)
+
+
+def reset_query_stats():
+    """Clear all statement metrics and the slow-query log."""
+    with _lock:
+        _statements.clear()
+        _slow_queries.clear()
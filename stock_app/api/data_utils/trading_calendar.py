@@ -0,0 +1,158 @@
+"""Answer trading-day questions from an in-memory trading calendar.
+
+The calendar is read once from the `trading_days` table, which the loader
+rebuilds from the prices, and is reloaded whenever the data version in
+`stock_stats` changes. Dates are `%Y-%m-%d` strings.
+"""
+
+import threading
+from bisect import bisect_left
+from datetime import date, datetime, timedelta
+
+from stock_app.api.data_utils.loading_utils import (
+    execute_stock_q,
+    get_data_version,
+)
+
+EPOCH = date(1970, 1, 1)
+
+
+def parse_day(date_string):
+    """Convert a `%Y-%m-%d` date string to a day number.
+
+    Args:
+        date_string (str): Date to convert.
+
+    Returns:
+        int or None: Days since 1970-01-01, or None if the value is not a
+            zero-padded `%Y-%m-%d` date.
+    """
+    try:
+        parsed = datetime.strptime(date_string, "%Y-%m-%d").date()
+    except (TypeError, ValueError):
+        return None
+    if parsed.isoformat() != date_string:
+        return None
+    return (parsed - EPOCH).days
+
+
+def format_day(day):
+    """Convert a day number back to a `%Y-%m-%d` date string."""
+    return (EPOCH + timedelta(days=day)).isoformat()
+
+
+class TradingCalendar:
+    """Sorted trading days with O(1) membership and O(log n) search."""
+
+    def __init__(self, days, version=0):
+        """Build the calendar.
+
+        Args:
+            days (list[int]): Trading day numbers in ascending order.
+            version (int): Data version the days were read at.
+        """
+        self.days = days
+        self.version = version
+        self._positions = {day: i for i, day in enumerate(days)}
+
+    def __len__(self):
+        """Return the number of trading days."""
+        return len(self.days)
+
+    def is_trading_day(self, date_string):
+        """Check whether prices exist for a date.
+
+        Args:
+            date_string (str): Date to check.
+
+        Returns:
+            bool: True if the date is a trading day.
+        """
+        return parse_day(date_string) in self._positions
+
+    def position(self, date_string):
+        """Return the index of a trading day in `days`.
+
+        Args:
+            date_string (str): Date to look up.
+
+        Returns:
+            int or None: Index of the date, or None if it is not a trading
+                day.
+        """
+        return self._positions.get(parse_day(date_string))
+
+    def shift(self, date_string, n):
+        """Move a date by `n` trading days.
+
+        From a non-trading date, one step back is the previous trading day
+        and one step forward is the next one.
+
+        Args:
+            date_string (str): Date to start from.
+            n (int): Trading days to move; negative moves back.
+
+        Returns:
+            str or None: The resulting trading day, or None if it falls
+                outside the calendar or the date is invalid.
+        """
+        day = parse_day(date_string)
+        if day is None:
+            return None
+        position = self._positions.get(day)
+        if position is None:
+            if n == 0:
+                return None
+            position = bisect_left(self.days, day)
+            # Position is the next trading day; step back one when counting
+            # forward from the gap
+            position += n - 1 if n > 0 else n
+        else:
+            position += n
+        if not 0 <= position < len(self.days):
+            return None
+        return format_day(self.days[position])
+
+    def next_trading_day(self, date_string):
+        """Return the first trading day after a date, or None."""
+        return self.shift(date_string, 1)
+
+    def previous_trading_day(self, date_string):
+        """Return the last trading day before a date, or None."""
+        return self.shift(date_string, -1)
+
+
+_lock = threading.Lock()
+_calendar = TradingCalendar([], version=-1)
+
+
+def load_trading_calendar(conn=None):
+    """Read the trading calendar from the database.
+
+    Args:
+        conn (sqlite3.Connection, optional): Read connection to use, e.g.
+            from `read_snapshot`.
+
+    Returns:
+        TradingCalendar: Calendar of all loaded trading days.
+    """
+    version = get_data_version(conn)
+    rows = execute_stock_q(
+        "SELECT day FROM trading_days ORDER BY day", conn=conn
+    )
+    return TradingCalendar([row[0] for row in rows], version)
+
+
+def get_trading_calendar():
+    """Return the cached trading calendar, reloading it after a data load.
+
+    Returns:
+        TradingCalendar: Calendar matching the current data version.
+    """
+    global _calendar
+    version = get_data_version()
+    if _calendar.version != version:
+        with _lock:
+            if _calendar.version != version:
+                _calendar = load_trading_calendar()
+    return _calendar
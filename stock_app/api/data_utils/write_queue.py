@@ -0,0 +1,222 @@
+"""Serialize database writes through a single writer thread.
+
+All writes are queued to one thread that owns the only read-write
+connection. The thread drains whatever is waiting into a group, runs each
+statement in its own savepoint and commits the group in one transaction.
+A failing statement only rolls back its own savepoint. Callers block on a
+future until the group containing their statement has committed.
+"""
+
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future
+from pathlib import Path
+
+from stock_app.api.data_utils.query_stats import record_query
+from stock_app.api.logger_utils.custom_logger import custom_logger
+
+MAX_GROUP_SIZE = 64
+WRITE_RETRIES = 5
+RETRY_BACKOFF = 0.05  # Seconds, doubled after every failed attempt
+
+WriteResult = namedtuple("WriteResult", ["rowcount", "lastrowid"])
+
+
+def is_busy_error(error):
+    """Check whether an SQLite error means the database was locked.
+
+    Args:
+        error (sqlite3.Error): Error raised by SQLite.
+
+    Returns:
+        bool: True if the operation can be retried.
+    """
+    message = str(error).lower()
+    return isinstance(error, sqlite3.OperationalError) and (
+        "locked" in message or "busy" in message
+    )
+
+
+def file_identity(path):
+    """Identify the file at a path, to detect it being replaced.
+
+    Args:
+        path (str): Path to the file.
+
+    Returns:
+        tuple or None: Device and inode numbers, or None if the file does
+            not exist.
+    """
+    try:
+        stat = Path(path).stat()
+    except FileNotFoundError:
+        return None
+    return stat.st_dev, stat.st_ino
+
+
+class WriteQueue:
+    """Single-writer queue with group commit.
+
+    The writer thread and its connection are started on first use, and
+    again after a fork. The connection is reopened when the database file
+    is deleted or replaced.
+    """
+
+    def __init__(self, db_path, pragmas=None, max_group_size=MAX_GROUP_SIZE):
+        """Create a queue; the writer thread starts on the first submit.
+
+        Args:
+            db_path (str): Path to the SQLite database.
+            pragmas (dict, optional): Pragmas applied to the connection.
+            max_group_size (int): Most statements committed together.
+        """
+        self.db_path = db_path
+        self.pragmas = pragmas or {}
+        self.max_group_size = max_group_size
+        self._queue = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def submit(self, sql, parameters=()):
+        """Queue a write statement.
+
+        Args:
+            sql (str): SQL statement.
+            parameters (tuple): Statement parameters.
+
+        Returns:
+            concurrent.futures.Future: Resolves to a `WriteResult` once
+                the statement is committed, or to the statement's error.
+        """
+        future = Future()
+        self._ensure_started()
+        self._queue.put((sql, parameters, future))
+        return future
+
+    def execute(self, sql, parameters=()):
+        """Queue a write statement and wait for it to be committed.
+
+        Args:
+            sql (str): SQL statement.
+            parameters (tuple): Statement parameters.
+
+        Returns:
+            WriteResult: Affected row count and last inserted row ID.
+        """
+        return self.submit(sql, parameters).result()
+
+    def _ensure_started(self):
+        """Start the writer thread if this process has none yet."""
+        with self._lock:
+            if self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._queue = queue.SimpleQueue()
+            self._thread = threading.Thread(
+                target=self._run,
+                args=(self._queue,),
+                name="db-writer",
+                daemon=True,
+            )
+            self._thread.start()
+
+    def _connect(self):
+        """Open and configure the writer connection.
+
+        Returns:
+            tuple: The connection and the identity of its database file.
+        """
+        identity = file_identity(self.db_path)
+        conn = sqlite3.connect(
+            self.db_path, isolation_level=None, check_same_thread=False
+        )
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn, identity
+
+    def _run(self, pending):
+        """Writer loop: take a group of statements and commit it."""
+        conn = identity = None
+        while True:
+            group = [pending.get()]
+            while len(group) < self.max_group_size:
+                try:
+                    group.append(pending.get_nowait())
+                except queue.Empty:
+                    break
+            if conn is not None and identity != file_identity(self.db_path):
+                # The database was replaced; never write to the old file
+                conn.close()
+                conn = None
+            try:
+                if conn is None:
+                    conn, identity = self._connect()
+                results = self._commit_group(conn, group)
+            except sqlite3.Error as e:
+                custom_logger.error(f"Write group failed: {e}")
+                for _, _, future in group:
+                    future.set_exception(e)
+                continue
+            for (_, _, future), result in zip(group, results, strict=True):
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    def _commit_group(self, conn, group):
+        """Run a group in one transaction, retrying while the DB is locked.
+
+        Args:
+            conn (sqlite3.Connection): Writer connection.
+            group (list): Queued `(sql, parameters, future)` entries.
+
+        Returns:
+            list: A `WriteResult` or the raised error for each entry.
+        """
+        for attempt in range(WRITE_RETRIES):
+            try:
+                return self._run_group(conn, group)
+            except sqlite3.Error as e:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                if not is_busy_error(e) or attempt == WRITE_RETRIES - 1:
+                    raise
+                delay = RETRY_BACKOFF * 2**attempt
+                custom_logger.warning(
+                    f"Database busy, retrying write group in {delay:.2f}s"
+                )
+                time.sleep(delay)
+        return []
+
+    def _run_group(self, conn, group):
+        """Execute each statement in its own savepoint and commit."""
+        results = []
+        conn.execute("BEGIN IMMEDIATE")
+        for sql, parameters, _ in group:
+            conn.execute("SAVEPOINT statement")
+            start = time.perf_counter()
+            try:
+                cur = conn.execute(sql, parameters)
+            except sqlite3.Error as e:
+                if is_busy_error(e):
+                    raise
+                conn.execute("ROLLBACK TO statement")
+                conn.execute("RELEASE statement")
+                results.append(e)
+                continue
+            conn.execute("RELEASE statement")
+            record_query(
+                conn,
+                sql,
+                parameters,
+                time.perf_counter() - start,
+                max(cur.rowcount, 0),
+            )
+            results.append(WriteResult(cur.rowcount, cur.lastrowid))
+        conn.execute("COMMIT")
+        return results
@@ -56,12 +56,16 @@ def log_route(func):
                 response_obj = Response(response)
                 response_obj.status_code = 200
 
-        # Log the outgoing response safely
+        # Log the outgoing response safely; reading a streamed body would
+        # consume it before it is sent
         try:
+            body = (
+                "<streamed>"
+                if response_obj.is_streamed
+                else response_obj.get_data(as_text=True)
+            )
             custom_logger.debug(
-                "Response: "
-                f"Status={response_obj.status_code}, "
-                f"Body={response_obj.get_data(as_text=True)}"
+                f"Response: Status={response_obj.status_code}, Body={body}"
             )
         except Exception as e:
             custom_logger.error(f"Failed to log response body: {e}")
@@ -86,7 +86,7 @@ def get_year_count(year):
         if not year.isdigit() or len(year) != FOUR_DIGIT_YEAR_LENGTH:
             return Response(status=400)
 
-        query = "SELECT COUNT(*) FROM stocks WHERE SUBSTRING(Date, 1, 4) = ?"
+        query = "SELECT value FROM stock_stats WHERE kind = 'year' AND key = ?"
         result = execute_stock_q(query, (year,), fetch_all=False)
 
         count = result[0] if result else 0
@@ -1,7 +1,12 @@
 """Tests for the Flask application."""
 
+import json
 import os
+import sqlite3
 import sys
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 import pytest
@@ -11,8 +16,37 @@ from jsonschema import validate
 sys.path.append(str(Path(__file__).parent.parent.resolve()))
 
 from flask_app import create_app  # noqa E402
+from stock_app.api.backtesting.engine import (  # noqa E402
+    run_backtest,
+    run_backtest_streaming,
+)
+from stock_app.api.backtesting.result_cache import (  # noqa E402
+    ResultCache,
+)
+from stock_app.api.data_utils import (  # noqa E402
+    loading_utils,
+    price_cube,
+    trading_calendar,
+)
+from stock_app.api.data_utils.loading_utils import (  # noqa E402
+    READ_POOL_PRAGMAS,
+    ConnectionPool,
+    create_stocks_db,
+    load_csv_to_db,
+    read_load_manifest,
+    refresh_stock_stats,
+    refresh_trading_days,
+)
+from stock_app.api.data_utils.price_cube import get_price_cube  # noqa E402
+from stock_app.api.data_utils.trading_calendar import (  # noqa E402
+    TradingCalendar,
+    format_day,
+)
+from stock_app.api.data_utils.write_queue import WriteQueue  # noqa E402
 
 HTTP_OK = 200
+HTTP_ACCEPTED = 202
+HTTP_BAD_REQUEST = 400
 HTTP_UNAUTHORIZED = 401
 HTTP_NOT_FOUND = 404
 
@@ -451,3 +485,549 @@ def test_13_explict_test(client):
         actual_response["num_observations"]
         == expected_response["num_observations"]
     )
+
+
+def test_14_v4_backtest_batch(client):
+    """Test the /api/v4/back_test/batch endpoint with a parameter grid.
+
+    Verifies one result per combination, each matching the single
+    /api/v4/back_test response for the same parameters.
+    """
+    schema = {
+        "type": "object",
+        "properties": {
+            "results": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "params": {"type": "object"},
+                        "return": {"type": "number"},
+                        "num_observations": {"type": "integer"},
+                    },
+                    "required": ["params", "return", "num_observations"],
+                },
+            }
+        },
+        "required": ["results"],
+    }
+
+    os.environ["DATA_241_API_KEY"] = "disha"
+
+    headers = {"DATA-241-API-KEY": "disha"}
+
+    grid = {
+        "value_1": ["O1", "H3"],
+        "value_2": "C1",
+        "operator": ["LT", "LTE"],
+        "purchase_type": ["B", "S"],
+        "start_date": "2020-01-03",
+        "end_date": "2020-01-03",
+    }
+
+    response = client.post(
+        "/api/v4/back_test/batch", headers=headers, json={"grid": grid}
+    )
+    assert response.status_code == HTTP_OK
+    assert response.content_type == "application/json"
+
+    results = response.get_json()["results"]
+    validate(instance=response.get_json(), schema=schema)
+    combinations = len(grid["value_1"]) * len(grid["operator"])
+    combinations *= len(grid["purchase_type"])
+    assert len(results) == combinations
+
+    for result in results:
+        single = client.post(
+            "/api/v4/back_test", headers=headers, json=result["params"]
+        )
+        assert single.get_json() == {
+            "return": result["return"],
+            "num_observations": result["num_observations"],
+        }
+
+    # Rejected without expanding all 10**12 combinations
+    fields = ["value_1", "value_2", "start_date", "end_date", "market"]
+    huge = {field: list(range(100)) for field in [*fields, "lag_unit"]}
+    response = client.post(
+        "/api/v4/back_test/batch", headers=headers, json={"grid": huge}
+    )
+    assert response.status_code == HTTP_BAD_REQUEST
+
+
+def test_15_v4_backtest_job(client):
+    """Test submitting and polling an asynchronous backtest job.
+
+    Verifies the job finishes with the same result as /api/v4/back_test.
+    """
+    os.environ["DATA_241_API_KEY"] = "disha"
+
+    headers = {"DATA-241-API-KEY": "disha"}
+
+    payload = {
+        "value_1": "O1",
+        "value_2": "C1",
+        "operator": "LT",
+        "purchase_type": "B",
+        "start_date": "2020-01-03",
+        "end_date": "2020-01-03",
+    }
+
+    submit = client.post(
+        "/api/v4/back_test/jobs", headers=headers, json=payload
+    )
+    assert submit.status_code == HTTP_ACCEPTED
+    job_id = submit.get_json()["job_id"]
+
+    for _ in range(100):
+        result = client.get(
+            f"/api/v4/back_test/jobs/{job_id}/result", headers=headers
+        )
+        if result.status_code != HTTP_ACCEPTED:
+            break
+        time.sleep(0.05)
+
+    assert result.status_code == HTTP_OK
+    expected = client.post("/api/v4/back_test", headers=headers, json=payload)
+    assert result.get_json() == expected.get_json()
+
+    status = client.get(f"/api/v4/back_test/jobs/{job_id}", headers=headers)
+    assert status.get_json()["status"] == "done"
+
+    missing = client.get("/api/v4/back_test/jobs/unknown", headers=headers)
+    assert missing.status_code == HTTP_NOT_FOUND
+
+
+def test_16_v4_backtest_strategy(client):
+    """Test backtesting with a strategy expression.
+
+    Verifies a strategy matches the equivalent legacy fields and that an
+    invalid expression is rejected with 400.
+    """
+    os.environ["DATA_241_API_KEY"] = "disha"
+
+    headers = {"DATA-241-API-KEY": "disha"}
+
+    dates = {
+        "purchase_type": "B",
+        "start_date": "2020-01-03",
+        "end_date": "2020-01-03",
+    }
+    legacy = {"value_1": "O1", "value_2": "C1", "operator": "LT", **dates}
+
+    response = client.post(
+        "/api/v4/back_test",
+        headers=headers,
+        json={"strategy": "o1 < C1", **dates},
+    )
+    assert response.status_code == HTTP_OK
+    expected = client.post("/api/v4/back_test", headers=headers, json=legacy)
+    assert response.get_json() == expected.get_json()
+
+    response = client.post(
+        "/api/v4/back_test",
+        headers=headers,
+        json={"strategy": "O1 < AND C1", **dates},
+    )
+    assert response.status_code == HTTP_BAD_REQUEST
+    assert "error" in response.get_json()
+
+
+def test_17_v4_backtest_universe(client):
+    """Test restricting a backtest to a market or list of symbols.
+
+    Verifies the per-market observations add up to the unfiltered
+    backtest and that an unknown market is rejected with 400.
+    """
+    os.environ["DATA_241_API_KEY"] = "disha"
+
+    headers = {"DATA-241-API-KEY": "disha"}
+
+    payload = {
+        "value_1": "O1",
+        "value_2": "C1",
+        "operator": "LT",
+        "purchase_type": "B",
+        "start_date": "2020-01-03",
+        "end_date": "2020-01-03",
+    }
+
+    total = client.post("/api/v4/back_test", headers=headers, json=payload)
+    assert total.status_code == HTTP_OK
+
+    observations = 0
+    for market in ["nasdaq", "nyse"]:
+        response = client.post(
+            "/api/v4/back_test",
+            headers=headers,
+            json={**payload, "market": market},
+        )
+        assert response.status_code == HTTP_OK
+        observations += response.get_json()["num_observations"]
+    assert observations == total.get_json()["num_observations"]
+
+    response = client.post(
+        "/api/v4/back_test",
+        headers=headers,
+        json={**payload, "symbols": ["AAPL"], "market": "lse"},
+    )
+    assert response.status_code == HTTP_BAD_REQUEST
+
+
+def test_18_v4_backtest_detail(client):
+    """Test the per-symbol and equity curve backtest output.
+
+    Verifies the breakdown adds up to the totals and that the NDJSON
+    stream carries the same result.
+    """
+    os.environ["DATA_241_API_KEY"] = "disha"
+
+    headers = {"DATA-241-API-KEY": "disha"}
+
+    payload = {
+        "value_1": "O1",
+        "value_2": "C1",
+        "operator": "LT",
+        "purchase_type": "B",
+        "start_date": "2020-01-02",
+        "end_date": "2020-01-03",
+        "detail": True,
+    }
+
+    response = client.post("/api/v4/back_test", headers=headers, json=payload)
+    assert response.status_code == HTTP_OK
+    result = response.get_json()
+    assert sum(row["num_observations"] for row in result["symbols"]) == (
+        result["num_observations"]
+    )
+    assert result["equity_curve"][-1]["date"] == payload["end_date"]
+    assert result["equity_curve"][-1]["equity"] == pytest.approx(
+        result["return"], abs=0.01
+    )
+
+    stream = client.post(
+        "/api/v4/back_test",
+        headers={**headers, "Accept": "application/x-ndjson"},
+        json=payload,
+    )
+    assert stream.status_code == HTTP_OK
+    assert stream.mimetype == "application/x-ndjson"
+    body = stream.get_data(as_text=True)
+    lines = [json.loads(line) for line in body.splitlines()]
+    assert lines[0] == {
+        "type": "summary",
+        "return": result["return"],
+        "num_observations": result["num_observations"],
+    }
+    assert len(lines) == 1 + len(result["symbols"]) + len(
+        result["equity_curve"]
+    )
+
+
+def test_19_v4_backtest_trading_lag(client):
+    """Test lags counted in trading days.
+
+    Verifies a one-day lag on a Monday only finds prices in trading days
+    and that an unknown lag unit is rejected with 400.
+    """
+    os.environ["DATA_241_API_KEY"] = "disha"
+
+    headers = {"DATA-241-API-KEY": "disha"}
+
+    payload = {
+        "strategy": "O1 > 0",
+        "purchase_type": "B",
+        "start_date": "2020-01-06",
+        "end_date": "2020-01-06",
+    }
+
+    calendar = client.post("/api/v4/back_test", headers=headers, json=payload)
+    assert calendar.status_code == HTTP_OK
+    assert calendar.get_json()["num_observations"] == 0
+
+    trading = client.post(
+        "/api/v4/back_test",
+        headers=headers,
+        json={**payload, "lag_unit": "trading"},
+    )
+    assert trading.status_code == HTTP_OK
+    assert trading.get_json()["num_observations"] > 0
+
+    response = client.post(
+        "/api/v4/back_test",
+        headers=headers,
+        json={**payload, "lag_unit": "weeks"},
+    )
+    assert response.status_code == HTTP_BAD_REQUEST
+
+
+def create_versioned_db(db_path, version):
+    """Create a database holding one `version` row."""
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.execute("CREATE TABLE info (version INTEGER)")
+        conn.execute("INSERT INTO info VALUES (?)", (version,))
+    conn.close()
+
+
+def test_20_pool_reconnects_after_file_swap(tmp_path):
+    """Test that pooled connections follow a replaced database file.
+
+    Verifies an idle connection to a deleted and recreated database is
+    not reused.
+    """
+    db_path = str(tmp_path / "swap.db")
+    old_version, new_version = 1, 2
+    create_versioned_db(db_path, old_version)
+    pool = ConnectionPool(db_path, read_only=True)
+
+    with pool.connection() as conn:
+        row = conn.execute("SELECT version FROM info").fetchone()
+    assert row[0] == old_version
+
+    Path(db_path).unlink()
+    create_versioned_db(db_path, new_version)
+
+    with pool.connection() as conn:
+        row = conn.execute("SELECT version FROM info").fetchone()
+    assert row[0] == new_version
+    assert pool.usage()["health_check_failures"] == 1
+
+    # A failed connect must not leave the connection counted as in use
+    Path(db_path).unlink()
+    with pytest.raises(sqlite3.OperationalError), pool.connection():
+        pass
+    assert pool.usage()["in_use"] == 0
+    pool.close_all()
+
+
+def test_21_writer_reconnects_after_file_swap(tmp_path):
+    """Test that the writer follows a replaced database file.
+
+    Verifies a write queued after the database was deleted and recreated
+    lands in the new file.
+    """
+    db_path = str(tmp_path / "swap.db")
+    create_versioned_db(db_path, 1)
+    writer = WriteQueue(db_path)
+    writer.execute("INSERT INTO info VALUES (?)", (10,))
+
+    Path(db_path).unlink()
+    create_versioned_db(db_path, 2)
+    writer.execute("INSERT INTO info VALUES (?)", (20,))
+
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute("SELECT version FROM info ORDER BY version")
+    assert [row[0] for row in rows] == [2, 20]
+    conn.close()
+
+
+def test_22_v4_backtest_cache(client):
+    """Test the backtest result cache and its metrics route.
+
+    Verifies a repeated backtest is a cache hit with the same result and
+    that a `detail` request is not served the plain cached result.
+    """
+    os.environ["DATA_241_API_KEY"] = "disha"
+
+    headers = {"DATA-241-API-KEY": "disha"}
+
+    payload = {
+        "value_1": "H2",
+        "value_2": "C1",
+        "operator": "GTE",
+        "purchase_type": "S",
+        "start_date": "2020-01-02",
+        "end_date": "2020-01-03",
+    }
+
+    def metrics():
+        response = client.get(
+            "/api/v4/back_test/cache/metrics", headers=headers
+        )
+        assert response.status_code == HTTP_OK
+        return response.get_json()
+
+    first = client.post("/api/v4/back_test", headers=headers, json=payload)
+    before = metrics()
+    second = client.post("/api/v4/back_test", headers=headers, json=payload)
+    after = metrics()
+    assert second.get_json() == first.get_json()
+    assert after["hits"] == before["hits"] + 1
+
+    detail = client.post(
+        "/api/v4/back_test",
+        headers=headers,
+        json={**payload, "detail": True},
+    )
+    assert detail.status_code == HTTP_OK
+    assert "equity_curve" in detail.get_json()
+    assert metrics()["misses"] == after["misses"] + 1
+
+
+@pytest.mark.parametrize("lag_unit", ["calendar", "trading"])
+def test_23_streaming_engine_parity(lag_unit):
+    """Test the streaming engine against the price cube engine.
+
+    Uses windows of a few trading days, so lag buffers carry rows across
+    many windows, and compares plain and `detail` results.
+    """
+    cube = get_price_cube()
+    days = cube.calendar.days
+    base = {
+        "purchase_type": "B",
+        "start_date": format_day(days[len(days) // 4]),
+        "end_date": format_day(days[-1]),
+        "lag_unit": lag_unit,
+    }
+    strategies = [
+        {"value_1": "O1", "value_2": "C1", "operator": "LT"},
+        {"value_1": "H3", "value_2": "L7", "operator": "GTE"},
+        {"strategy": "C1 - O2 > 0 OR NOT H5 > L1"},
+    ]
+
+    for strategy in strategies:
+        params = {**base, **strategy}
+        total, observations = run_backtest(cube, params)
+        for window_days in [1, 3, 10]:
+            streamed = run_backtest_streaming(params, window_days=window_days)
+            assert streamed[1] == observations
+            assert streamed[0] == pytest.approx(total, abs=1e-9)
+
+    params = {**base, **strategies[-1], "detail": True}
+    expected = run_backtest(cube, params)[2]
+    detail = run_backtest_streaming(params, window_days=3)[2]
+    assert detail["symbols"] == expected["symbols"]
+    assert [point["date"] for point in detail["equity_curve"]] == [
+        point["date"] for point in expected["equity_curve"]
+    ]
+    for point, expected_point in zip(
+        detail["equity_curve"], expected["equity_curve"], strict=True
+    ):
+        assert point["equity"] == pytest.approx(
+            expected_point["equity"], abs=0.01
+        )
+
+
+def create_price_db(db_path, symbols, num_days):
+    """Create a database with one price row per symbol and day."""
+    create_stocks_db()
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.executemany(
+            "INSERT INTO symbols (id, Symbol) VALUES (?, ?)",
+            enumerate(symbols, start=1),
+        )
+        conn.executemany(
+            "INSERT INTO prices VALUES (?, ?, 0, 1.0, 2.0, 0.5, 1.5, 100)",
+            [
+                (symbol_id, 18_000 + day)
+                for symbol_id in range(1, len(symbols) + 1)
+                for day in range(num_days)
+            ],
+        )
+    refresh_trading_days(conn)
+    refresh_stock_stats(conn)
+    conn.commit()
+    conn.close()
+
+
+def test_24_price_cube_reloads_after_rebuild(tmp_path, monkeypatch):
+    """Test that the price cube follows a deleted and recreated database.
+
+    Verifies the rebuilt database's data version differs from the old
+    one even though both were loaded once.
+    """
+    db_path = str(tmp_path / "stocks.db")
+    monkeypatch.setattr(loading_utils, "DB_PATH", db_path)
+    monkeypatch.setattr(
+        loading_utils,
+        "read_pool",
+        ConnectionPool(db_path, READ_POOL_PRAGMAS, read_only=True),
+    )
+    monkeypatch.setattr(price_cube, "_cube", None)
+    monkeypatch.setattr(
+        trading_calendar, "_calendar", TradingCalendar([], version=-1)
+    )
+
+    create_price_db(db_path, ["AAA", "BBB"], 3)
+    cube = get_price_cube()
+    assert cube.symbols == ["AAA", "BBB"]
+
+    for suffix in ["", "-wal", "-shm"]:
+        Path(f"{db_path}{suffix}").unlink(missing_ok=True)
+    new_days = 2
+    create_price_db(db_path, ["CCC"], new_days)
+
+    rebuilt = get_price_cube()
+    assert rebuilt.version != cube.version
+    assert rebuilt.symbols == ["CCC"]
+    assert len(rebuilt.days) == new_days
+    loading_utils.read_pool.close_all()
+
+
+def test_25_parallel_load_keeps_batches_before_parse_error(
+    tmp_path, monkeypatch
+):
+    """Test loading an archive whose member fails to parse part-way.
+
+    Verifies the batches parsed before the error are inserted and that
+    only the intact member is recorded in the load manifest.
+    """
+    db_path = str(tmp_path / "stocks.db")
+    monkeypatch.setattr(loading_utils, "DB_PATH", db_path)
+    create_stocks_db()
+
+    header = "Symbol,Date,Open,High,Low,Close,Volume\n"
+    rows = [
+        f"{symbol},0{day}-Jan-2020,1,2,0.5,1.5,100\n"
+        for symbol, day in [("AAA", 2), ("BBB", 2), ("BBB", 3)]
+    ]
+    zip_path = tmp_path / "NASDAQ.zip"
+    with zipfile.ZipFile(zip_path, "w") as zf:
+        zf.writestr("good.csv", header + rows[0])
+        # The unterminated quote fails the second chunk of two rows
+        zf.writestr("bad.csv", header + "".join(rows[1:]) + 'BBB,"06-Jan')
+
+    conn = sqlite3.connect(db_path)
+    with ProcessPoolExecutor(max_workers=1) as pool:
+        load_csv_to_db(conn, str(zip_path), pool, batch_size=2)
+    conn.commit()
+
+    inserted_rows = 3
+    assert (
+        conn.execute("SELECT COUNT(*) FROM prices").fetchone()[0]
+        == inserted_rows
+    )
+    assert list(read_load_manifest(conn, "NASDAQ.zip")) == ["good.csv"]
+    conn.close()
+
+
+def test_26_result_cache_versions():
+    """Test that the result cache keys results on the version computed at.
+
+    Verifies a result computed at a newer version than the request's is
+    cached under the newer version, and that a request holding an older
+    version neither drops nor overwrites the newer entries.
+    """
+    cache = ResultCache()
+    params = {
+        "strategy": "O1 < C1",
+        "purchase_type": "B",
+        "start_date": "2020-01-02",
+        "end_date": "2020-01-03",
+    }
+    old_version, new_version = 1, 2
+
+    result = cache.get_or_compute(
+        old_version, params, lambda: (new_version, "new")
+    )
+    assert result == "new"
+    assert cache.get_or_compute(new_version, params, None) == "new"
+
+    result = cache.get_or_compute(
+        old_version, params, lambda: (old_version, "old")
+    )
+    assert result == "old"
+    assert cache.get_or_compute(new_version, params, None) == "new"
+    assert cache.stats()["invalidations"] == 0